@@ -5,14 +5,28 @@ Provides interface for document loading and question answering.
 
 import sys
 import os
+import time
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                              QHBoxLayout, QPushButton, QTextEdit, QLabel, 
                              QFileDialog, QMessageBox, QProgressBar, QTabWidget,
-                             QListWidget, QSplitter)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+                             QListWidget, QListWidgetItem, QSplitter)
+from PyQt5.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QFont
 from embed_store import DocumentStore
-from qa_engine import QAEngine
+from qa_engine import QAEngine, CancelToken
+from resource_manager import ResourceManager
+
+# Unload models after this many seconds without a question or document load
+MODEL_IDLE_TIMEOUT = 15 * 60
+# Unload idle models when free system memory drops below this (MB)
+MIN_AVAILABLE_MB = 1024
+# How often to check idle time and memory pressure (ms)
+RESOURCE_CHECK_INTERVAL = 30 * 1000
+
+
+class ResourceSignals(QObject):
+    """Forwards ResourceManager status messages from worker threads to the UI."""
+    status = pyqtSignal(str)
 
 
 class DocumentLoadThread(QThread):
@@ -31,17 +45,34 @@ class DocumentLoadThread(QThread):
         self.finished.emit(result)
 
 
+class DocumentReplaceThread(QThread):
+    """Thread for re-ingesting one document without blocking UI."""
+    finished = pyqtSignal(str, int)
+    
+    def __init__(self, doc_store, file_path, new_path):
+        super().__init__()
+        self.doc_store = doc_store
+        self.file_path = file_path
+        self.new_path = new_path
+    
+    def run(self):
+        chunks = self.doc_store.replace_document(self.file_path, self.new_path)
+        self.finished.emit(self.new_path, chunks)
+
+
 class QAThread(QThread):
     """Thread for answering questions without blocking UI."""
     finished = pyqtSignal(dict)
     
-    def __init__(self, qa_engine, question):
+    def __init__(self, qa_engine, question, cancel_token):
         super().__init__()
         self.qa_engine = qa_engine
         self.question = question
+        self.cancel_token = cancel_token
     
     def run(self):
-        result = self.qa_engine.answer_question(self.question)
+        result = self.qa_engine.answer_question(self.question,
+                                                cancel_token=self.cancel_token)
         self.finished.emit(result)
 
 
@@ -50,6 +81,10 @@ class ExamQAApp(QMainWindow):
         super().__init__()
         self.doc_store = None
         self.qa_engine = None
+        self.resource_signals = ResourceSignals()
+        self.resources = ResourceManager(idle_timeout=MODEL_IDLE_TIMEOUT,
+                                         min_available_mb=MIN_AVAILABLE_MB,
+                                         on_status=self.resource_signals.status.emit)
         self.init_ui()
         self.init_engines()
     
@@ -101,11 +136,22 @@ class ExamQAApp(QMainWindow):
         doc_layout.addWidget(self.doc_status)
         
         # Loaded files list
-        list_label = QLabel("Loaded Document Chunks:")
+        list_label = QLabel("Loaded Documents:")
         doc_layout.addWidget(list_label)
         self.loaded_files_list = QListWidget()
         doc_layout.addWidget(self.loaded_files_list)
         
+        source_btn_layout = QHBoxLayout()
+        self.btn_remove_doc = QPushButton("Remove Selected")
+        self.btn_remove_doc.clicked.connect(self.remove_document)
+        source_btn_layout.addWidget(self.btn_remove_doc)
+        
+        self.btn_replace_doc = QPushButton("Replace Selected...")
+        self.btn_replace_doc.clicked.connect(self.replace_document)
+        source_btn_layout.addWidget(self.btn_replace_doc)
+        
+        doc_layout.addLayout(source_btn_layout)
+        
         tabs.addTab(doc_tab, "Document Management")
         
         # Q&A Tab
@@ -122,11 +168,19 @@ class ExamQAApp(QMainWindow):
         self.question_input.setPlaceholderText("Type your exam question here...")
         qa_layout.addWidget(self.question_input)
         
-        # Ask button
+        # Ask and cancel buttons
+        ask_layout = QHBoxLayout()
         self.btn_ask = QPushButton("Get Answer")
         self.btn_ask.clicked.connect(self.ask_question)
         self.btn_ask.setEnabled(False)
-        qa_layout.addWidget(self.btn_ask)
+        ask_layout.addWidget(self.btn_ask)
+        
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.clicked.connect(self.cancel_question)
+        self.btn_cancel.setEnabled(False)
+        ask_layout.addWidget(self.btn_cancel)
+        
+        qa_layout.addLayout(ask_layout)
         
         # Answer display
         answer_label = QLabel("📝 Answer:")
@@ -150,13 +204,24 @@ class ExamQAApp(QMainWindow):
         
         # Status bar
         self.statusBar().showMessage("Ready - Please load documents first")
+        
+        # Per-model memory usage, kept in the status bar
+        self.memory_label = QLabel()
+        self.statusBar().addPermanentWidget(self.memory_label)
+        self.resource_signals.status.connect(self.on_resource_status)
+        
+        self.resource_timer = QTimer(self)
+        self.resource_timer.timeout.connect(self.check_resources)
+        self.resource_timer.start(RESOURCE_CHECK_INTERVAL)
     
     def init_engines(self):
         """Initialize document store and QA engine."""
         try:
-            self.doc_store = DocumentStore()
-            self.qa_engine = QAEngine()
-            self.update_doc_count()
+            self.doc_store = DocumentStore(resources=self.resources)
+            self.qa_engine = QAEngine(resources=self.resources)
+            if self.update_doc_count():
+                self.btn_ask.setEnabled(True)
+            self.update_memory_usage()
         except Exception as e:
             QMessageBox.critical(self, "Initialization Error", 
                                f"Failed to initialize engines:\n{str(e)}")
@@ -173,7 +238,7 @@ class ExamQAApp(QMainWindow):
         if not file_paths:
             return
         
-        self.btn_load_docs.setEnabled(False)
+        self.set_document_actions_enabled(False)
         self.doc_status.append(f"Selected {len(file_paths)} file(s)")
         
         # Start loading thread
@@ -188,7 +253,7 @@ class ExamQAApp(QMainWindow):
     
     def on_load_finished(self, result):
         """Handle document loading completion."""
-        self.btn_load_docs.setEnabled(True)
+        self.set_document_actions_enabled(True)
         
         msg = f"\n✅ Loading Complete!\n"
         msg += f"Processed Files: {result['processed_files']}\n"
@@ -202,6 +267,12 @@ class ExamQAApp(QMainWindow):
         QMessageBox.information(self, "Success", 
                               f"Successfully loaded {result['processed_files']} document(s)")
     
+    def set_document_actions_enabled(self, enabled):
+        """Allow one document change at a time: disable them while a load or replace runs."""
+        for button in (self.btn_load_docs, self.btn_clear_db,
+                       self.btn_remove_doc, self.btn_replace_doc):
+            button.setEnabled(enabled)
+    
     def clear_database(self):
         """Clear all documents from database."""
         reply = QMessageBox.question(self, "Confirm Clear",
@@ -216,10 +287,92 @@ class ExamQAApp(QMainWindow):
             self.statusBar().showMessage("Database cleared - Please load documents")
     
     def update_doc_count(self):
-        """Update the document count display."""
-        count = self.doc_store.get_collection_count()
+        """Update the loaded documents list from the source registry."""
         self.loaded_files_list.clear()
-        self.loaded_files_list.addItem(f"Total chunks in database: {count}")
+        for entry in self.doc_store.list_documents():
+            ingested = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry['ingested_at']))
+            item = QListWidgetItem(f"{entry['source']} — {entry['chunks']} chunks, "
+                                   f"{entry['tokens']} tokens, added {ingested}")
+            item.setData(Qt.UserRole, entry['path'])
+            item.setToolTip(entry['path'])
+            self.loaded_files_list.addItem(item)
+        
+        count = self.doc_store.get_collection_count()
+        if not self.loaded_files_list.count():
+            self.loaded_files_list.addItem(f"Total chunks in database: {count}")
+        return count
+    
+    def selected_document(self):
+        """Return the path of the selected document, or None."""
+        item = self.loaded_files_list.currentItem()
+        return item.data(Qt.UserRole) if item else None
+    
+    def remove_document(self):
+        """Remove the selected document's chunks from the database."""
+        file_path = self.selected_document()
+        if not file_path:
+            return
+        
+        reply = QMessageBox.question(self, "Confirm Remove",
+                                    f"Remove {os.path.basename(file_path)} from the database?",
+                                    QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        
+        removed = self.doc_store.remove_document(file_path)
+        self.doc_status.append(f"\n🗑️ Removed {os.path.basename(file_path)} ({removed} chunks)")
+        if not self.update_doc_count():
+            self.btn_ask.setEnabled(False)
+    
+    def replace_document(self):
+        """Replace the selected document with a new version."""
+        file_path = self.selected_document()
+        if not file_path:
+            return
+        
+        new_path, _ = QFileDialog.getOpenFileName(
+            self,
+            f"Replace {os.path.basename(file_path)}",
+            os.path.dirname(file_path),
+            "Documents (*.pdf *.docx *.txt);;All Files (*.*)"
+        )
+        if not new_path:
+            return
+        
+        self.set_document_actions_enabled(False)
+        self.doc_status.append(f"Replacing {os.path.basename(file_path)}...")
+        self.replace_thread = DocumentReplaceThread(self.doc_store, file_path, new_path)
+        self.replace_thread.finished.connect(self.on_replace_finished)
+        self.replace_thread.start()
+    
+    def on_replace_finished(self, new_path, chunks):
+        """Handle document replacement completion."""
+        self.set_document_actions_enabled(True)
+        if chunks:
+            self.doc_status.append(f"✅ Replaced with {os.path.basename(new_path)} ({chunks} chunks)")
+        else:
+            self.doc_status.append(f"⚠️ No text in {os.path.basename(new_path)} - kept old version")
+        self.update_doc_count()
+    
+    def check_resources(self):
+        """Unload idle models and refresh the memory display."""
+        self.resources.check()
+        self.update_memory_usage()
+    
+    def on_resource_status(self, message):
+        """Show model warm-up and unload messages."""
+        self.statusBar().showMessage(message)
+        self.update_memory_usage()
+    
+    def update_memory_usage(self):
+        """Update the per-model memory usage display."""
+        parts = []
+        for info in self.resources.usage().values():
+            if info['loaded']:
+                parts.append(f"{info['label']}: {info['size_mb']:.0f} MB")
+            else:
+                parts.append(f"{info['label']}: unloaded")
+        self.memory_label.setText(" | ".join(parts))
     
     def ask_question(self):
         """Process user question."""
@@ -230,17 +383,26 @@ class ExamQAApp(QMainWindow):
             return
         
         self.btn_ask.setEnabled(False)
+        self.btn_cancel.setEnabled(True)
         self.answer_display.setText("🔍 Searching documents and generating answer...")
         self.sources_display.clear()
         
         # Start QA thread
-        self.qa_thread = QAThread(self.qa_engine, question)
+        self.cancel_token = CancelToken()
+        self.qa_thread = QAThread(self.qa_engine, question, self.cancel_token)
         self.qa_thread.finished.connect(self.on_answer_ready)
         self.qa_thread.start()
     
+    def cancel_question(self):
+        """Stop the running answer generation."""
+        self.cancel_token.cancel()
+        self.btn_cancel.setEnabled(False)
+        self.statusBar().showMessage("Cancelling...")
+    
     def on_answer_ready(self, result):
         """Display the generated answer."""
         self.btn_ask.setEnabled(True)
+        self.btn_cancel.setEnabled(False)
         
         # Display answer
         self.answer_display.setText(result['answer'])
@@ -252,7 +414,16 @@ class ExamQAApp(QMainWindow):
         else:
             self.sources_display.setText("No sources found")
         
-        self.statusBar().showMessage("Answer generated")
+        if result.get('from_bank'):
+            self.statusBar().showMessage("Answer served from question bank")
+        elif result.get('cancelled'):
+            self.statusBar().showMessage("Answer cancelled")
+        elif result.get('stats'):
+            stats = result['stats']
+            self.statusBar().showMessage(
+                f"Answer generated ({stats['tokens']} tokens, {stats['latency']:.1f}s)")
+        else:
+            self.statusBar().showMessage("Answer generated")
 
 
 def main():
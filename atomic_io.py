@@ -0,0 +1,31 @@
+"""
+Crash-safe file writes for checkpoints and small state files.
+"""
+
+import os
+import json
+import tempfile
+from typing import Any
+
+
+def write_json(path: str, data: Any):
+    """
+    Write data as JSON so readers see either the old or the new file.
+
+    The data goes to a uniquely named temporary file in the same folder,
+    which then replaces the target, so concurrent writers never share a
+    temporary file and a crash never leaves the target half-written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory,
+                                     prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        tmp_path = f.name
+        try:
+            json.dump(data, f)
+        except BaseException:
+            f.close()
+            os.remove(tmp_path)
+            raise
+    os.replace(tmp_path, path)
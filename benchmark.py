@@ -0,0 +1,337 @@
+"""
+Benchmark script for the exam QA system.
+Measures extraction speed and memory on generated or user-supplied documents.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import zipfile
+import multiprocessing
+import numpy as np
+from xml.sax.saxutils import escape
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DOCX_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>
+</Types>"""
+
+DOCX_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>
+</Relationships>"""
+
+
+def make_docx(path: str, paragraphs: int = 50000, table_rows: int = 5000):
+    """Write a large synthetic DOCX with paragraphs and a question table."""
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", DOCX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", DOCX_RELS)
+        with archive.open("word/document.xml", "w") as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                    b'<w:document xmlns:w="http://schemas.openxmlformats.org/'
+                    b'wordprocessingml/2006/main"><w:body>')
+            for i in range(paragraphs):
+                text = escape(f"Paragraph {i}: Python lists are ordered, mutable collections.")
+                f.write(f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'.encode())
+            f.write(b"<w:tbl>")
+            for i in range(table_rows):
+                q = escape(f"Question {i}: What is a tuple?")
+                a = escape(f"Answer {i}: An ordered, immutable collection.")
+                f.write(f"<w:tr><w:tc><w:p><w:r><w:t>{q}</w:t></w:r></w:p></w:tc>"
+                        f"<w:tc><w:p><w:r><w:t>{a}</w:t></w:r></w:p></w:tc></w:tr>".encode())
+            f.write(b"</w:tbl></w:body></w:document>")
+
+
+def make_pdf(path: str, pages: int = 500, lines_per_page: int = 40,
+             positioned_words: bool = False):
+    """
+    Write a synthetic text-only PDF with the given number of pages.
+
+    With positioned_words, words are separated by TJ offsets instead of
+    space characters, as TeX output often is.
+    """
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for p in range(pages):
+        lines = [f"Page {p + 1} line {i}: Tuples are ordered, immutable collections."
+                 for i in range(lines_per_page)]
+        if positioned_words:
+            shows = ["T* [" + " -400 ".join(f"({w})" for w in line.split()) + "] TJ"
+                     for line in lines]
+        else:
+            shows = [f"({line}) '" for line in lines]
+        stream = "BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(shows) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode())
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+                f"startxref\n{xref}\n%%EOF\n".encode())
+
+
+def bench_pdf(file_path: str = None):
+    """Compare pages/sec per PDF backend, in-process and page-parallel."""
+    from extractors import available_pdf_backends, extract_pdf_pages, pdf_page_count
+
+    print("\n" + "=" * 60)
+    print("BENCHMARK: PDF extraction")
+    print("=" * 60)
+
+    if file_path is None:
+        file_path = os.path.join(tempfile.mkdtemp(), "large.pdf")
+        make_pdf(file_path)
+
+    pages = pdf_page_count(file_path)
+    print(f"File: {file_path} ({pages} pages, {os.cpu_count()} CPUs)")
+
+    for backend in available_pdf_backends():
+        for label, workers in [("serial", 1), ("parallel", None)]:
+            start = time.perf_counter()
+            try:
+                result = extract_pdf_pages(file_path, backend=backend, workers=workers)
+            except Exception as e:
+                print(f"{backend:11} {label:9} failed: {e}")
+                break
+            elapsed = time.perf_counter() - start
+            chars = sum(len(text) for _, text in result)
+            print(f"{backend:11} {label:9} {elapsed:8.2f}s  {pages / elapsed:8.1f} pages/sec  "
+                  f"{chars} chars")
+
+
+def _python_docx_text(file_path: str) -> str:
+    """Reference extractor: python-docx paragraphs only."""
+    from docx import Document
+    doc = Document(file_path)
+    return "\n".join(p.text for p in doc.paragraphs).strip()
+
+
+def _streaming_docx_text(file_path: str) -> str:
+    from extractors import extract_docx_text
+    return extract_docx_text(file_path)
+
+
+def _run_measured(func, args, queue):
+    start = time.perf_counter()
+    try:
+        result = func(*args)
+    except Exception as e:
+        queue.put(e)
+        return
+    elapsed = time.perf_counter() - start
+    peak_mb = None
+    if resource is not None:
+        # ru_maxrss is KB on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    queue.put((elapsed, peak_mb, len(result)))
+
+
+def measure(func, *args):
+    """Run func in a fresh process and return (seconds, peak RSS MB, result length)."""
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_run_measured, args=(func, args, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def _noop(*args):
+    return ""
+
+
+def bench_docx(file_path: str = None):
+    """Compare streaming DOCX extraction against python-docx."""
+    print("\n" + "=" * 60)
+    print("BENCHMARK: DOCX extraction")
+    print("=" * 60)
+
+    if file_path is None:
+        file_path = os.path.join(tempfile.mkdtemp(), "large.docx")
+        make_docx(file_path)
+
+    size_mb = os.path.getsize(file_path) / (1024 * 1024)
+    print(f"File: {file_path} ({size_mb:.1f} MB)")
+
+    _, baseline_mb, _ = measure(_noop, file_path)
+    for name, func in [("python-docx", _python_docx_text),
+                       ("streaming", _streaming_docx_text)]:
+        try:
+            elapsed, peak_mb, chars = measure(func, file_path)
+        except Exception as e:
+            print(f"{name:15} failed: {e}")
+            continue
+        if peak_mb is not None:
+            mem = f"peak RSS {peak_mb:.1f} MB (+{peak_mb - baseline_mb:.1f} MB)"
+        else:
+            mem = "peak RSS n/a"
+        print(f"{name:15} {elapsed:8.2f}s  {mem}  {chars} chars")
+
+
+GENERATION_QUESTIONS = [
+    "Who created Python?",
+    "When was Python first released?",
+    "What are the key features of Python?",
+    "Explain the difference between a list and a tuple.",
+    "What is Java?",  # not in the materials
+]
+
+
+def bench_generation(db_path: str = "./chroma_db", questions: list = None):
+    """
+    Compare fixed 300-token generation against adaptive max_tokens with
+    stop sequences, and full prompts against the instruction-prefix
+    session, on documents already loaded into db_path.
+    """
+    from qa_engine import QAEngine
+
+    print("\n" + "=" * 60)
+    print("BENCHMARK: Answer generation")
+    print("=" * 60)
+
+    engine = QAEngine(db_path=db_path)
+    questions = questions or GENERATION_QUESTIONS
+    contexts = [engine.retrieve_context(q) for q in questions]
+
+    modes = [("fixed 300", False, {'max_tokens': 300, 'early_stop': False}),
+             ("adaptive", False, {}),
+             ("session", True, {})]
+    for name, session, kwargs in modes:
+        engine.prefix_session = session
+        tokens, latency, prompt_eval = [], [], []
+        for question, ctx in zip(questions, contexts):
+            _, stats = engine._generate(question, ctx, **kwargs)
+            tokens.append(stats['tokens'])
+            latency.append(stats['latency'])
+            prompt_eval.append(stats['prompt_eval'] or 0.0)
+        n = len(questions)
+        print(f"{name:12} avg tokens {sum(tokens) / n:6.1f}  "
+              f"avg latency {sum(latency) / n:6.2f}s  "
+              f"avg prompt eval {sum(prompt_eval) / n:6.2f}s")
+
+
+# Rows per ChromaDB add() call
+CHROMA_BATCH = 5000
+
+
+def _synthetic_corpus(n_chunks: int, dim: int, rng):
+    """Clustered embeddings: each document has a topic, its chunks drift around it."""
+    chunks_per_doc = 200
+    n_docs = max(1, n_chunks // chunks_per_doc)
+    topics = rng.normal(size=(n_docs, dim))
+    doc_of_chunk = np.repeat(np.arange(n_docs), chunks_per_doc)[:n_chunks]
+    embeddings = topics[doc_of_chunk] + 0.6 * rng.normal(size=(n_chunks, dim))
+    return embeddings.astype(np.float32), doc_of_chunk
+
+
+def bench_retrieval(sizes: list = None, dim: int = 384, top_k: int = 5, queries: int = 50,
+                    search_ef: int = None):
+    """
+    Compare flat search against two-stage section search on synthetic
+    corpora of growing size. Recall@k is measured against exact search.
+    """
+    import chromadb
+    from chromadb.config import Settings
+    from retrieval import SEARCH_EF, section_id, section_centroids, flat_search, two_stage_search
+
+    search_ef = search_ef or SEARCH_EF
+
+    print("\n" + "=" * 60)
+    print(f"BENCHMARK: Retrieval (flat vs two-stage, hnsw:search_ef={search_ef})")
+    print("=" * 60)
+
+    rng = np.random.default_rng(0)
+    for n_chunks in sizes or [10000, 100000]:
+        embeddings, doc_of_chunk = _synthetic_corpus(n_chunks, dim, rng)
+        # Same ID scheme as DocumentStore, so sections map to chunk IDs
+        ids = [f"d{d}_{i % 200}" for i, d in enumerate(doc_of_chunk)]
+        texts = [f"c{i}" for i in range(n_chunks)]
+        sections = [section_id(f"d{d}", i % 200) for i, d in enumerate(doc_of_chunk)]
+
+        client = chromadb.Client(Settings(anonymized_telemetry=False, allow_reset=True))
+        client.reset()
+        collection = client.create_collection("bench_chunks", metadata={"hnsw:space": "cosine",
+                                                                        "hnsw:search_ef": search_ef})
+        centroid_col = client.create_collection("bench_centroids", metadata={"hnsw:space": "cosine"})
+        for start in range(0, n_chunks, CHROMA_BATCH):
+            end = start + CHROMA_BATCH
+            collection.add(ids=ids[start:end], embeddings=embeddings[start:end].tolist(),
+                           documents=texts[start:end],
+                           metadatas=[{"section": s} for s in sections[start:end]])
+        centroids = section_centroids(sections, embeddings)
+        centroid_ids = list(centroids)
+        for start in range(0, len(centroid_ids), CHROMA_BATCH):
+            batch = centroid_ids[start:start + CHROMA_BATCH]
+            centroid_col.add(ids=batch, embeddings=[centroids[c].tolist() for c in batch])
+
+        normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        query_vectors = embeddings[rng.integers(0, n_chunks, queries)] + 0.3 * rng.normal(size=(queries, dim))
+
+        for name, search in [("flat", lambda q: flat_search(collection, q, top_k)),
+                             ("two-stage", lambda q: two_stage_search(collection, centroid_col, q, top_k))]:
+            latencies, recalls = [], []
+            for q in query_vectors:
+                exact = set(np.argsort(-normed @ (q / np.linalg.norm(q)))[:top_k])
+                start = time.perf_counter()
+                found = search(q.tolist())
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(exact & {int(c['text'][1:]) for c in found}) / top_k)
+            print(f"{n_chunks:>9} chunks  {name:10} {1000 * np.median(latencies):8.1f} ms median  "
+                  f"recall@{top_k} {np.mean(recalls):.3f}")
+
+
+def main():
+    """Run benchmarks on files given on the command line or generated ones."""
+    args = sys.argv[1:]
+    if args and args[0] == "generation":
+        bench_generation(*args[1:2])
+        return
+    if args and args[0] == "retrieval":
+        rest = args[1:]
+        search_ef = None
+        if "--ef" in rest:
+            i = rest.index("--ef")
+            search_ef = int(rest[i + 1])
+            del rest[i:i + 2]
+        bench_retrieval([int(n) for n in rest] or None, search_ef=search_ef)
+        return
+
+    if args and args[0] == "pdf":
+        for path in args[1:] or [None]:
+            bench_pdf(path)
+        return
+
+    docx_files = [p for p in args if p.lower().endswith(".docx")]
+    for path in docx_files or [None]:
+        bench_docx(path)
+
+
+if __name__ == "__main__":
+    main()
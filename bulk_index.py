@@ -0,0 +1,217 @@
+"""
+Headless bulk indexer for large document archives.
+Walks a directory tree and stores documents in checkpointed batches so an
+interrupted run can resume where it stopped.
+
+Usage:
+    python bulk_index.py /path/to/archive [--db ./chroma_db] [--batch-size 50]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from typing import Callable, Dict, List
+
+from atomic_io import write_json
+from embed_store import DocumentStore, SUPPORTED_EXTENSIONS
+from extractors import PDF_BACKENDS
+
+
+def _file_signature(file_path: str) -> List:
+    stat = os.stat(file_path)
+    return [stat.st_mtime, stat.st_size]
+
+
+class BulkIndexer:
+    def __init__(self, doc_store: DocumentStore, root: str, batch_size: int = 50,
+                 state_path: str = None):
+        """
+        Initialize bulk indexer.
+
+        Args:
+            doc_store: DocumentStore to write into
+            root: Directory tree to index
+            batch_size: Files per checkpointed batch
+            state_path: Checkpoint file (default: inside the database folder,
+                one per root directory)
+        """
+        self.doc_store = doc_store
+        self.root = os.path.abspath(root)
+        self.batch_size = batch_size
+
+        if state_path is None:
+            root_hash = hashlib.md5(self.root.encode()).hexdigest()[:8]
+            state_path = os.path.join(doc_store.db_path, f"bulk_index_{root_hash}.json")
+        self.state_path = state_path
+        self.state = self._load_state()
+
+    def _load_state(self) -> Dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {"root": self.root, "done": {}, "quarantine": {}, "empty": {}}
+
+    def _save_state(self):
+        """Write the checkpoint atomically so a crash never leaves it half-written."""
+        write_json(self.state_path, self.state)
+
+    def discover(self) -> List[str]:
+        """List supported files under root in a stable order."""
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                    files.append(os.path.join(dirpath, name))
+        return files
+
+    def _is_stored(self, file_path: str) -> bool:
+        """Whether the file's chunks are still in the store (or it had none)."""
+        # The database may have been cleared, or the document removed, since
+        # the checkpoint was written
+        return file_path in self.doc_store.registry or file_path in self.state.get("empty", {})
+
+    def pending(self, files: List[str], retry_quarantined: bool = False) -> List[str]:
+        """Files not yet indexed, changed since they were indexed, or no longer stored."""
+        result = []
+        for file_path in files:
+            if file_path in self.state["quarantine"] and not retry_quarantined:
+                continue
+            try:
+                if (self.state["done"].get(file_path) == _file_signature(file_path)
+                        and self._is_stored(file_path)):
+                    continue
+            except OSError:
+                # Removed since discovery
+                continue
+            result.append(file_path)
+        return result
+
+    def _quarantine(self, file_path: str, error: Exception):
+        self.state["quarantine"][file_path] = {
+            "error": f"{type(error).__name__}: {error}",
+            "time": time.time()
+        }
+
+    def _index_batch(self, batch: List[str]) -> int:
+        """Extract, embed and store one batch. Returns the number of chunks stored."""
+        prepared = {}
+        for file_path in batch:
+            try:
+                doc = self.doc_store.prepare_document(file_path, strict=True)
+            except Exception as e:
+                self._quarantine(file_path, e)
+                continue
+            prepared[file_path] = doc or {"ids": [], "chunks": [], "metadatas": []}
+
+        ids, chunks, metadatas = [], [], []
+        for doc in prepared.values():
+            ids += doc["ids"]
+            chunks += doc["chunks"]
+            metadatas += doc["metadatas"]
+
+        try:
+            self.doc_store.store_chunks(ids, chunks, metadatas)
+        except Exception:
+            # Isolate the file that broke the batch
+            for file_path, doc in list(prepared.items()):
+                try:
+                    self.doc_store.store_chunks(doc["ids"], doc["chunks"], doc["metadatas"])
+                except Exception as e:
+                    self._quarantine(file_path, e)
+                    del prepared[file_path]
+
+        empty = self.state.setdefault("empty", {})
+        for file_path in batch:
+            if file_path in prepared:
+                self.state["done"][file_path] = _file_signature(file_path)
+                self.state["quarantine"].pop(file_path, None)
+                if prepared[file_path]["chunks"]:
+                    empty.pop(file_path, None)
+                else:
+                    empty[file_path] = True
+        return sum(len(doc["chunks"]) for doc in prepared.values())
+
+    def run(self, retry_quarantined: bool = False,
+            progress: Callable[[str], None] = print) -> Dict[str, int]:
+        """
+        Index all pending files, checkpointing after every batch.
+
+        Args:
+            retry_quarantined: Try previously failing files again
+            progress: Callback receiving progress lines
+
+        Returns:
+            Dictionary with statistics for this run
+        """
+        files = self.discover()
+        todo = self.pending(files, retry_quarantined)
+        progress(f"{len(files)} files found, {len(files) - len(todo)} already indexed, "
+                 f"{len(todo)} to index")
+
+        start = time.time()
+        processed = 0
+        total_chunks = 0
+
+        for i in range(0, len(todo), self.batch_size):
+            batch = todo[i:i + self.batch_size]
+            total_chunks += self._index_batch(batch)
+            self._save_state()
+
+            processed += len(batch)
+            elapsed = time.time() - start
+            rate = processed / elapsed if elapsed > 0 else 0.0
+            eta = (len(todo) - processed) / rate if rate > 0 else 0.0
+            progress(f"[{processed}/{len(todo)}] {rate:.2f} files/sec, "
+                     f"ETA {eta / 60:.1f} min, {len(self.state['quarantine'])} quarantined")
+
+        return {
+            "processed_files": processed,
+            "total_chunks": total_chunks,
+            "quarantined": sum(1 for f in todo if f in self.state["quarantine"]),
+            "elapsed": time.time() - start
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a directory tree of exam documents.")
+    parser.add_argument("root", help="Directory to index")
+    parser.add_argument("--db", default="./chroma_db", help="ChromaDB path")
+    parser.add_argument("--batch-size", type=int, default=50, help="Files per checkpoint")
+    parser.add_argument("--retry-quarantined", action="store_true",
+                        help="Retry files that failed in an earlier run")
+    parser.add_argument("--pdf-workers", type=int, default=1,
+                        help="Processes for page-parallel PDF extraction (0: CPU count)")
+    parser.add_argument("--pdf-backend", choices=PDF_BACKENDS, default="pdfplumber",
+                        help="PDF text extractor (pdfminer and pypdfium2 are faster)")
+    parser.add_argument("--section-centroids", action="store_true",
+                        help="Store section centroids for two-stage retrieval")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}")
+        sys.exit(1)
+
+    doc_store = DocumentStore(db_path=args.db, pdf_backend=args.pdf_backend,
+                              pdf_workers=args.pdf_workers,
+                              build_centroids=args.section_centroids)
+    indexer = BulkIndexer(doc_store, args.root, args.batch_size)
+    try:
+        result = indexer.run(retry_quarantined=args.retry_quarantined)
+    except KeyboardInterrupt:
+        print("\nInterrupted - run the same command again to resume from the last checkpoint")
+        sys.exit(130)
+
+    print(f"\n✅ Indexed {result['processed_files']} files, {result['total_chunks']} chunks "
+          f"in {result['elapsed']:.0f}s")
+    if indexer.state["quarantine"]:
+        print(f"⚠️  {len(indexer.state['quarantine'])} files quarantined (see {indexer.state_path}):")
+        for file_path, info in indexer.state["quarantine"].items():
+            print(f"  {file_path}: {info['error']}")
+
+
+if __name__ == "__main__":
+    main()
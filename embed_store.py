@@ -4,29 +4,70 @@ Handles PDF, DOCX, and TXT files for offline exam system.
 """
 
 import os
-import pdfplumber
-from docx import Document
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
 import hashlib
+import numpy as np
+from extractors import extract_docx_text, extract_pdf_pages
+from resource_manager import ResourceManager
+from source_registry import SourceRegistry, chunk_ids
+from embedding_cache import EmbeddingCache
+from retrieval import CENTROID_COLLECTION, SEARCH_EF, section_id, section_centroids
+from question_bank import QuestionBank
+
+# sentence_transformers (torch) and chromadb load on first use, so scripts
+# and spawned PDF workers can import this module cheaply
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.docx', '.txt')
+
+# Largest number of chunks sent to ChromaDB in one call
+MAX_UPSERT_BATCH = 5000
+
+
+def load_embedder(model_name: str) -> "SentenceTransformer":
+    """Load a SentenceTransformer model, importing the library on first use."""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
 
 
 class DocumentStore:
-    def __init__(self, db_path: str = "./chroma_db", model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, db_path: str = "./chroma_db", model_name: str = "all-MiniLM-L6-v2",
+                 resources: ResourceManager = None, embedding_cache_mb: int = 512,
+                 pdf_backend: str = "pdfplumber", pdf_workers: int = 1,
+                 build_centroids: bool = False):
         """
         Initialize document store with local ChromaDB and SentenceTransformer.
         
         Args:
             db_path: Path to store ChromaDB data
             model_name: SentenceTransformer model name
+            resources: Shared ResourceManager; the embedder is loaded lazily
+                through it and may be unloaded when idle
+            embedding_cache_mb: Disk budget for cached chunk embeddings
+                (0 disables the cache)
+            pdf_backend: PDF text backend: "pdfplumber", "pdfminer" (no
+                layout analysis) or "pypdfium2" (fastest, if installed)
+            pdf_workers: Processes for page-parallel PDF extraction
+                (default 1 extracts in-process; 0 uses the CPU count)
+            build_centroids: Compute section centroids while storing, for
+                QAEngine's "two_stage" retrieval strategy
         """
         self.db_path = db_path
-        self.embedding_model = SentenceTransformer(model_name)
+        self.pdf_backend = pdf_backend
+        self.pdf_workers = pdf_workers
+        self.build_centroids = build_centroids
+        self.resources = resources or ResourceManager(idle_timeout=0)
+        self._embedder_key = f"embedder:{model_name}"
+        self.resources.register(self._embedder_key,
+                                lambda: load_embedder(model_name),
+                                label="Embedder")
         
         # Initialize ChromaDB with local persistence
+        import chromadb
+        from chromadb.config import Settings
         self.client = chromadb.Client(Settings(
+            is_persistent=True,
             persist_directory=db_path,
             anonymized_telemetry=False
         ))
@@ -34,46 +75,93 @@ class DocumentStore:
         # Get or create collection
         self.collection = self.client.get_or_create_collection(
             name="exam_documents",
+            metadata={"hnsw:space": "cosine", "hnsw:search_ef": SEARCH_EF}
+        )
+        
+        # Section-level centroids for coarse-to-fine retrieval
+        self.centroids = self.client.get_or_create_collection(
+            name=CENTROID_COLLECTION,
             metadata={"hnsw:space": "cosine"}
         )
+        
+        # Which chunk IDs belong to which source file
+        self.registry = SourceRegistry(os.path.join(db_path, "sources.sqlite"),
+                                       legacy_json=os.path.join(db_path, "sources.json"))
+        
+        # Embeddings survive clear_database so re-ingesting skips the model
+        self.embedding_cache = None
+        if embedding_cache_mb:
+            self.embedding_cache = EmbeddingCache(os.path.join(db_path, "embedding_cache"),
+                                                  model_name,
+                                                  max_bytes=embedding_cache_mb * 1024 * 1024)
+    
+    @property
+    def embedding_model(self) -> "SentenceTransformer":
+        """Embedding model, reloaded on demand if it was unloaded."""
+        return self.resources.get(self._embedder_key)
+    
+    def _read_pdf(self, file_path: str) -> str:
+        pages = extract_pdf_pages(file_path, self.pdf_backend, self.pdf_workers)
+        return "\n".join(text for _, text in pages if text).strip()
+    
+    def _read_txt(self, file_path: str) -> str:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
     
     def extract_text_from_pdf(self, file_path: str) -> str:
         """Extract text from PDF file."""
-        text = ""
         try:
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+            return self._read_pdf(file_path)
+        except Exception as e:
+            print(f"Error reading PDF {file_path}: {e}")
+            return ""
+    
+    def extract_pages_from_pdf(self, file_path: str, strict: bool = False) -> List[Tuple[int, str]]:
+        """Extract (page number, text) pairs from a PDF file in page order."""
+        try:
+            return extract_pdf_pages(file_path, self.pdf_backend, self.pdf_workers)
         except Exception as e:
+            if strict:
+                raise
             print(f"Error reading PDF {file_path}: {e}")
-        return text.strip()
+            return []
     
     def extract_text_from_docx(self, file_path: str) -> str:
-        """Extract text from DOCX file."""
-        text = ""
+        """Extract text from DOCX file, including table cells."""
         try:
-            doc = Document(file_path)
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
+            return extract_docx_text(file_path)
         except Exception as e:
             print(f"Error reading DOCX {file_path}: {e}")
-        return text.strip()
+            return ""
     
     def extract_text_from_txt(self, file_path: str) -> str:
         """Extract text from TXT file."""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read().strip()
+            return self._read_txt(file_path)
         except Exception as e:
             print(f"Error reading TXT {file_path}: {e}")
             return ""
     
-    def extract_text(self, file_path: str) -> str:
-        """Extract text based on file extension."""
+    def extract_text(self, file_path: str, strict: bool = False) -> str:
+        """
+        Extract text based on file extension.
+        
+        Args:
+            file_path: Document file path
+            strict: Raise on unreadable or unsupported files instead of
+                printing the error and returning ""
+        """
         ext = os.path.splitext(file_path)[1].lower()
         
+        if strict:
+            if ext == '.pdf':
+                return self._read_pdf(file_path)
+            elif ext == '.docx':
+                return extract_docx_text(file_path)
+            elif ext == '.txt':
+                return self._read_txt(file_path)
+            raise ValueError(f"Unsupported file type: {ext}")
+        
         if ext == '.pdf':
             return self.extract_text_from_pdf(file_path)
         elif ext == '.docx':
@@ -122,6 +210,193 @@ class DocumentStore:
         
         return [c for c in chunks if c]
     
+    def prepare_document(self, file_path: str, strict: bool = False) -> Optional[Dict]:
+        """
+        Extract and chunk one document without storing it.
+        
+        Args:
+            file_path: Document file path
+            strict: Raise on read errors instead of treating the file as
+                having no text
+        
+        Returns:
+            Dictionary with chunk ids, texts and metadatas, or None if the
+            file yielded no text (e.g. a scanned PDF without a text layer)
+        """
+        # PDFs are chunked per page so each chunk keeps its page number
+        if os.path.splitext(file_path)[1].lower() == '.pdf':
+            pages = self.extract_pages_from_pdf(file_path, strict=strict)
+        else:
+            pages = [(None, self.extract_text(file_path, strict=strict))]
+        
+        chunks = []
+        page_numbers = []
+        for page, text in pages:
+            for chunk in self.chunk_text(text.strip()):
+                chunks.append(chunk)
+                page_numbers.append(page)
+        
+        if not chunks:
+            return None
+        
+        # Create unique IDs for chunks; the full digest keeps IDs of different
+        # files from colliding, since upsert and removal rely on them
+        file_path = os.path.abspath(file_path)
+        file_hash = hashlib.md5(file_path.encode()).hexdigest()
+        source = os.path.basename(file_path)
+        metadatas = []
+        for i, page in enumerate(page_numbers):
+            metadata = {"source": source, "path": file_path, "doc_id": file_hash,
+                        "section": section_id(file_hash, i)}
+            if page is not None:
+                metadata["page"] = page
+            metadatas.append(metadata)
+        return {
+            "ids": [f"{file_hash}_{i}" for i in range(len(chunks))],
+            "chunks": chunks,
+            "metadatas": metadatas
+        }
+    
+    def embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        Embed chunks, reusing cached vectors and only encoding the rest.
+        
+        The embedder is not loaded at all when every chunk is cached.
+        """
+        if not self.embedding_cache:
+            with self.resources.use(self._embedder_key) as embedder:
+                return embedder.encode(chunks, show_progress_bar=False)
+        
+        vectors = self.embedding_cache.get_many(chunks)
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            with self.resources.use(self._embedder_key) as embedder:
+                encoded = embedder.encode([chunks[i] for i in missing], show_progress_bar=False)
+            self.embedding_cache.put_many([chunks[i] for i in missing], encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        return np.vstack(vectors).astype(np.float32)
+    
+    def store_chunks(self, ids: List[str], chunks: List[str], metadatas: List[Dict]):
+        """
+        Embed chunks and write them to ChromaDB.
+        
+        Uses upsert so re-storing a file after an interrupted run overwrites
+        its chunks instead of failing on duplicate IDs. Each source is then
+        recorded in the registry; for a source stored before, chunks left
+        over from an older, longer version and banked answers that drew on
+        it are deleted. With build_centroids, section centroids for
+        two-stage retrieval are recomputed for every stored source.
+        """
+        all_embeddings = []
+        for start in range(0, len(chunks), MAX_UPSERT_BATCH):
+            end = start + MAX_UPSERT_BATCH
+            
+            # Generate embeddings
+            embeddings = self.embed_chunks(chunks[start:end])
+            if self.build_centroids:
+                all_embeddings.append(embeddings)
+            
+            # Store in ChromaDB
+            self.collection.upsert(
+                embeddings=embeddings.tolist(),
+                documents=chunks[start:end],
+                ids=ids[start:end],
+                metadatas=metadatas[start:end]
+            )
+        
+        by_source = {}
+        for chunk_id, chunk, metadata in zip(ids, chunks, metadatas):
+            doc_id, source_ids, source_chunks = by_source.setdefault(
+                metadata["path"], (metadata["doc_id"], [], []))
+            source_ids.append(chunk_id)
+            source_chunks.append(chunk)
+        
+        bank = None
+        for file_path, (doc_id, source_ids, source_chunks) in by_source.items():
+            previous = self.registry.get(file_path)
+            if previous:
+                stale = list(set(chunk_ids(previous)) - set(source_ids))
+                if stale:
+                    self.collection.delete(ids=stale)
+                # Banked answers may quote the old version
+                bank = bank or QuestionBank(self.client, self.db_path)
+                bank.forget(file_path)
+            self.registry.add(file_path, doc_id, source_chunks)
+        
+        # Centroids of an older version are outdated either way
+        for file_path in by_source:
+            self.centroids.delete(where={"path": file_path})
+        if all_embeddings:
+            self._store_centroids(metadatas, np.vstack(all_embeddings))
+    
+    def _store_centroids(self, metadatas: List[Dict], embeddings: np.ndarray):
+        """Store the section centroids of the sources in this batch."""
+        centroids = section_centroids([m["section"] for m in metadatas], embeddings)
+        section_meta = {m["section"]: {"source": m["source"], "path": m["path"],
+                                       "doc_id": m["doc_id"]}
+                        for m in metadatas}
+        section_ids = list(centroids)
+        for start in range(0, len(section_ids), MAX_UPSERT_BATCH):
+            batch = section_ids[start:start + MAX_UPSERT_BATCH]
+            self.centroids.upsert(
+                ids=batch,
+                embeddings=[centroids[sid].tolist() for sid in batch],
+                metadatas=[section_meta[sid] for sid in batch]
+            )
+    
+    def list_documents(self) -> List[Dict]:
+        """Get registry entries (path, source, doc_id, chunks, tokens, ingested_at) per source."""
+        return self.registry.entries()
+    
+    def remove_document(self, file_path: str) -> int:
+        """
+        Remove one source's chunks from the collection.
+        
+        Args:
+            file_path: Path the document was loaded from
+        
+        Returns:
+            Number of chunks removed (0 if nothing was stored for the source)
+        """
+        file_path = os.path.abspath(file_path)
+        # Chunks are found by their path metadata, so chunks the registry
+        # does not know about are removed too
+        stored = self.collection.get(where={"path": file_path}, include=[])['ids']
+        if not stored and file_path not in self.registry:
+            return 0
+        
+        if stored:
+            self.collection.delete(ids=stored)
+        self.centroids.delete(where={"path": file_path})
+        QuestionBank(self.client, self.db_path).forget(file_path)
+        self.registry.remove(file_path)
+        return len(stored)
+    
+    def replace_document(self, file_path: str, new_path: Optional[str] = None) -> int:
+        """
+        Re-ingest one source, deleting only that source's old chunks.
+        
+        Args:
+            file_path: Path the document was loaded from
+            new_path: Updated file to load in its place (default: re-read file_path)
+        
+        Returns:
+            Number of chunks stored for the new version (0 if it had no
+            text, in which case the old version is kept)
+        """
+        new_path = new_path or file_path
+        prepared = self.prepare_document(new_path)
+        if not prepared:
+            print(f"No text extracted from: {new_path}")
+            return 0
+        
+        if os.path.abspath(new_path) != os.path.abspath(file_path):
+            self.remove_document(file_path)
+        # Same path: store_chunks drops the stale chunk IDs and banked answers itself
+        self.store_chunks(prepared["ids"], prepared["chunks"], prepared["metadatas"])
+        return len(prepared["chunks"])
+    
     def load_documents(self, file_paths: List[str]) -> Dict[str, int]:
         """
         Load multiple documents, extract text, generate embeddings, and store in ChromaDB.
@@ -142,35 +417,16 @@ class DocumentStore:
             
             print(f"Processing: {file_path}")
             
-            # Extract text
-            text = self.extract_text(file_path)
-            if not text:
+            prepared = self.prepare_document(file_path)
+            if not prepared:
                 print(f"No text extracted from: {file_path}")
                 continue
             
-            # Chunk text
-            chunks = self.chunk_text(text)
-            if not chunks:
-                continue
-            
-            # Generate embeddings
-            embeddings = self.embedding_model.encode(chunks, show_progress_bar=False)
-            
-            # Create unique IDs for chunks
-            file_hash = hashlib.md5(file_path.encode()).hexdigest()[:8]
-            ids = [f"{file_hash}_{i}" for i in range(len(chunks))]
+            self.store_chunks(prepared["ids"], prepared["chunks"], prepared["metadatas"])
             
-            # Store in ChromaDB
-            self.collection.add(
-                embeddings=embeddings.tolist(),
-                documents=chunks,
-                ids=ids,
-                metadatas=[{"source": os.path.basename(file_path)} for _ in chunks]
-            )
-            
-            total_chunks += len(chunks)
+            total_chunks += len(prepared["chunks"])
             processed_files += 1
-            print(f"  Added {len(chunks)} chunks")
+            print(f"  Added {len(prepared['chunks'])} chunks")
         
         return {
             "processed_files": processed_files,
@@ -183,8 +439,15 @@ class DocumentStore:
             self.client.delete_collection("exam_documents")
             self.collection = self.client.get_or_create_collection(
                 name="exam_documents",
+                metadata={"hnsw:space": "cosine", "hnsw:search_ef": SEARCH_EF}
+            )
+            self.client.delete_collection(CENTROID_COLLECTION)
+            self.centroids = self.client.get_or_create_collection(
+                name=CENTROID_COLLECTION,
                 metadata={"hnsw:space": "cosine"}
             )
+            QuestionBank(self.client, self.db_path).clear()
+            self.registry.clear()
             print("Database cleared successfully")
         except Exception as e:
             print(f"Error clearing database: {e}")
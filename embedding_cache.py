@@ -0,0 +1,237 @@
+"""
+Content-addressed on-disk cache of chunk embeddings.
+Vectors are kept as float16 rows in a memory-mapped file and indexed by
+(model name, chunk-text hash) in SQLite, with least-recently-used eviction
+bounded by disk size. Row allocation happens inside exclusive SQLite
+transactions, so several processes can share one cache.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from contextlib import contextmanager
+from typing import List, Optional
+
+
+# Rows added to the vector file each time it has to grow
+GROWTH_ROWS = 1024
+
+
+def chunk_key(text: str) -> str:
+    """Hash of the chunk text used as the cache key."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, cache_dir: str, model_name: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Open or create the cache for one embedding model.
+
+        Args:
+            cache_dir: Base cache directory; each model gets its own subfolder
+            model_name: Embedding model name, so vectors from different
+                models never mix
+            max_bytes: Upper bound for the vector file size
+        """
+        self.max_bytes = max_bytes
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name))
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._vectors_path = os.path.join(self.dir, "vectors.f16")
+        self._lock = threading.Lock()
+        # Transactions are managed explicitly (autocommit otherwise)
+        self._db = sqlite3.connect(os.path.join(self.dir, "index.sqlite"),
+                                   check_same_thread=False, isolation_level=None,
+                                   timeout=60)
+        self.dim = None
+        self._vectors = None
+        self._allocated_rows = 0
+        with self._transaction():
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                             "(key TEXT PRIMARY KEY, row INTEGER, last_used REAL)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_used)")
+            # Rows of the vector file not holding a vector; shared by all processes
+            self._db.execute("CREATE TABLE IF NOT EXISTS free_rows (row INTEGER PRIMARY KEY)")
+            self._sync()
+            if self.dim and not self._meta("free_rows_tracked"):
+                # Caches written before free rows were tracked in SQLite
+                used = {r for (r,) in self._db.execute("SELECT row FROM entries")}
+                self._db.executemany("INSERT OR IGNORE INTO free_rows VALUES (?)",
+                                     [(r,) for r in range(self._allocated_rows) if r not in used])
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES ('free_rows_tracked', 1)")
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of vectors that fit in max_bytes."""
+        if not self.dim:
+            return 0
+        return max(1, self.max_bytes // (self.dim * 2))
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Hold an exclusive lock on the index, across threads and processes.
+
+        Vector rows are read and written only inside it, so no process can
+        reuse a row while another one is reading it.
+        """
+        with self._lock:
+            self._db.execute("BEGIN EXCLUSIVE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _meta(self, name: str) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _sync(self):
+        """Pick up the dimension and file size another process may have set."""
+        if not self.dim:
+            self.dim = self._meta("dim")
+            if not self.dim:
+                return
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        rows = size // (self.dim * 2)
+        if rows != self._allocated_rows or (rows and self._vectors is None):
+            self._open_vectors(rows)
+
+    def _open_vectors(self, rows: int):
+        if self._vectors is not None:
+            self._vectors.flush()
+        self._allocated_rows = rows
+        self._vectors = None
+        if rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float16, mode='r+',
+                                      shape=(rows, self.dim))
+
+    def _free_count(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM free_rows").fetchone()[0]
+
+    def _grow(self, rows_needed: int):
+        """Extend the vector file so at least rows_needed more rows are free."""
+        new_rows = min(self.capacity,
+                       self._allocated_rows + max(rows_needed, GROWTH_ROWS))
+        if new_rows <= self._allocated_rows:
+            return
+        old_rows = self._allocated_rows
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._vectors = None
+        with open(self._vectors_path, 'ab') as f:
+            f.truncate(new_rows * self.dim * 2)
+        self._db.executemany("INSERT OR IGNORE INTO free_rows VALUES (?)",
+                             [(r,) for r in range(old_rows, new_rows)])
+        self._open_vectors(new_rows)
+
+    def _evict(self, count: int):
+        """Free the count least recently used rows."""
+        victims = self._db.execute(
+            "SELECT key, row FROM entries ORDER BY last_used LIMIT ?", (count,)
+        ).fetchall()
+        self._db.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in victims])
+        self._db.executemany("INSERT OR IGNORE INTO free_rows VALUES (?)",
+                             [(r,) for _, r in victims])
+
+    def _take_free_rows(self, count: int) -> List[int]:
+        rows = [r for (r,) in self._db.execute(
+            "SELECT row FROM free_rows ORDER BY row LIMIT ?", (count,))]
+        self._db.executemany("DELETE FROM free_rows WHERE row = ?", [(r,) for r in rows])
+        return rows
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached embeddings.
+
+        Returns:
+            One float32 vector per text, or None where the text is not cached
+        """
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        keys = [chunk_key(t) for t in texts]
+        with self._transaction():
+            self._sync()
+            if not self.dim or self._vectors is None:
+                return results
+
+            rows = {}
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._db.execute(
+                    f"SELECT key, row FROM entries WHERE key IN ({placeholders})", batch
+                ).fetchall())
+
+            for i, key in enumerate(keys):
+                if key in rows:
+                    results[i] = np.array(self._vectors[rows[key]], dtype=np.float32)
+
+            if rows:
+                now = time.time()
+                self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?",
+                                     [(now, k) for k in rows])
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Store embeddings, evicting least recently used ones when full."""
+        if not len(texts):
+            return
+        vectors = np.asarray(vectors)
+
+        with self._transaction():
+            self._sync()
+            if not self.dim:
+                self.dim = int(vectors.shape[1])
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('dim', ?)", (self.dim,))
+
+            # Deduplicate, and skip keys that are already stored
+            pending = {}
+            for text, vector in zip(texts, vectors):
+                pending[chunk_key(text)] = vector
+            existing = set()
+            keys = list(pending)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                existing.update(k for (k,) in self._db.execute(
+                    f"SELECT key FROM entries WHERE key IN ({placeholders})", batch))
+            for key in existing:
+                del pending[key]
+            if not pending:
+                return
+
+            # More new vectors than the whole cache holds: keep the last ones
+            items = list(pending.items())[-self.capacity:]
+
+            free = self._free_count()
+            if free < len(items):
+                self._grow(len(items) - free)
+                free = self._free_count()
+            if free < len(items):
+                self._evict(len(items) - free)
+
+            now = time.time()
+            entries = []
+            for (key, vector), row in zip(items, self._take_free_rows(len(items))):
+                self._vectors[row] = vector.astype(np.float16)
+                entries.append((key, row, now))
+            self._vectors.flush()
+            self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", entries)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        """Current size of the vector file on disk."""
+        if not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path)
@@ -0,0 +1,312 @@
+"""
+Streaming text extractors for exam documents.
+Reads document formats directly from their containers without building
+a full in-memory object model, and extracts large PDFs page-parallel.
+"""
+
+import os
+import atexit
+import threading
+import zipfile
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# Block types yielded by iter_docx_blocks
+PARAGRAPH = "paragraph"
+TABLE_CELL = "table_cell"
+
+
+def _run_text(run: ET.Element) -> str:
+    """Return the text of a w:r element the same way python-docx does."""
+    parts = []
+    for child in run:
+        tag = child.tag
+        if tag == W_NS + "t":
+            parts.append(child.text or "")
+        elif tag in (W_NS + "tab", W_NS + "ptab"):
+            parts.append("\t")
+        elif tag == W_NS + "br":
+            # Page and column breaks carry no text, only line breaks do
+            if child.get(W_NS + "type", "textWrapping") == "textWrapping":
+                parts.append("\n")
+        elif tag == W_NS + "cr":
+            parts.append("\n")
+        elif tag == W_NS + "noBreakHyphen":
+            parts.append("-")
+    return "".join(parts)
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    """Return the text of a w:p element from its direct runs and hyperlinks."""
+    parts = []
+    for child in paragraph:
+        if child.tag == W_NS + "r":
+            parts.append(_run_text(child))
+        elif child.tag == W_NS + "hyperlink":
+            for run in child:
+                if run.tag == W_NS + "r":
+                    parts.append(_run_text(run))
+    return "".join(parts)
+
+
+# Elements whose finished children are no longer needed while streaming
+_RELEASED_PARENTS = (W_NS + "body", W_NS + "tbl", W_NS + "tr", W_NS + "tc")
+
+
+def iter_docx_blocks(file_path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Stream paragraphs and table cells from a DOCX file in document order.
+
+    Parses word/document.xml incrementally straight from the zip archive and
+    discards each paragraph, table row and cell once it has been read, so
+    memory stays bounded by the largest single paragraph or table row.
+
+    Args:
+        file_path: Path to the DOCX file
+
+    Yields:
+        (block_type, text) tuples where block_type is PARAGRAPH or TABLE_CELL
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open("word/document.xml") as xml_file:
+            stack = []
+            cell_paragraphs = []
+
+            for event, elem in ET.iterparse(xml_file, events=("start", "end")):
+                if event == "start":
+                    stack.append(elem)
+                    if elem.tag == W_NS + "tc":
+                        cell_paragraphs.append([])
+                    continue
+
+                stack.pop()
+                parent = stack[-1] if stack else None
+                parent_tag = parent.tag if parent is not None else None
+
+                if elem.tag == W_NS + "p":
+                    # Paragraphs nested inside runs (text boxes) are not part
+                    # of the body or a cell and are skipped like python-docx does
+                    if parent_tag == W_NS + "body":
+                        yield PARAGRAPH, _paragraph_text(elem)
+                    elif parent_tag == W_NS + "tc":
+                        cell_paragraphs[-1].append(_paragraph_text(elem))
+                elif elem.tag == W_NS + "tc":
+                    cell_text = "\n".join(cell_paragraphs.pop())
+                    # Vertically merged continuation cells are empty
+                    if cell_text.strip():
+                        yield TABLE_CELL, cell_text
+
+                # Release finished blocks, rows and cells to keep memory flat;
+                # a table would otherwise keep all its rows until it ends
+                if parent_tag in _RELEASED_PARENTS:
+                    parent.remove(elem)
+
+
+def extract_docx_text(file_path: str) -> str:
+    """
+    Extract text from a DOCX file including table cells.
+
+    Paragraph text matches python-docx's ``paragraph.text``; each block is
+    placed on its own line.
+    """
+    return "\n".join(text for _, text in iter_docx_blocks(file_path)).strip()
+
+
+# PDF extraction backends, slowest and most layout-aware first
+PDF_BACKENDS = ("pdfplumber", "pdfminer", "pypdfium2")
+
+# PDFs with fewer pages are extracted in-process
+PARALLEL_MIN_PAGES = 40
+
+# Pages handed to one worker at a time
+PAGES_PER_TASK = 20
+
+# Gap between characters on one line, relative to the character size, read
+# as a word break when the PDF positions words without space characters
+# (same rule as pdfminer's default word_margin)
+WORD_GAP = 0.1
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def available_pdf_backends() -> List[str]:
+    """PDF backends that can be used in this installation."""
+    backends = ["pdfplumber", "pdfminer"]
+    if pypdfium2 is not None:
+        backends.append("pypdfium2")
+    return backends
+
+
+def pdf_page_count(file_path: str) -> int:
+    """Count pages without extracting any text."""
+    if pypdfium2 is not None:
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+    from pdfminer.pdfpage import PDFPage
+    with open(file_path, 'rb') as f:
+        return sum(1 for _ in PDFPage.get_pages(f))
+
+
+def _pdfplumber_pages(file_path: str, first: int, last: int) -> List[str]:
+    import pdfplumber
+    with pdfplumber.open(file_path, pages=list(range(first + 1, last + 1))) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def _pdfminer_layout_text(layout) -> str:
+    """Join characters in content-stream order, breaking lines where the baseline moves."""
+    from pdfminer.layout import LTChar, LTContainer, LTAnno
+
+    parts = []
+    last = None
+
+    def walk(item):
+        nonlocal last
+        if isinstance(item, LTChar):
+            if last is not None:
+                if abs(item.y0 - last.y0) > item.height / 2:
+                    parts.append("\n")
+                elif (item.x0 - last.x1 > WORD_GAP * max(item.width, item.height)
+                      and not parts[-1].isspace() and not item.get_text().isspace()):
+                    # Words placed apart by position (TJ offsets) carry no space
+                    parts.append(" ")
+            last = item
+            parts.append(item.get_text())
+        elif isinstance(item, LTAnno):
+            parts.append(item.get_text())
+        elif isinstance(item, LTContainer):
+            for child in item:
+                walk(child)
+
+    walk(layout)
+    return "".join(parts)
+
+
+def _pdfminer_pages(file_path: str, first: int, last: int) -> List[str]:
+    """pdfminer with layout analysis off: text in content-stream order."""
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+    from pdfminer.converter import PDFPageAggregator
+
+    texts = []
+    resources = PDFResourceManager(caching=True)
+    device = PDFPageAggregator(resources, laparams=None)
+    interpreter = PDFPageInterpreter(resources, device)
+    with open(file_path, 'rb') as f:
+        for page in PDFPage.get_pages(f, pagenos=set(range(first, last))):
+            interpreter.process_page(page)
+            texts.append(_pdfminer_layout_text(device.get_result()))
+    return texts
+
+
+def _pypdfium2_pages(file_path: str, first: int, last: int) -> List[str]:
+    texts = []
+    pdf = pypdfium2.PdfDocument(file_path)
+    try:
+        for index in range(first, last):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            texts.append(textpage.get_text_range().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return texts
+
+
+_PDF_READERS = {
+    "pdfplumber": _pdfplumber_pages,
+    "pdfminer": _pdfminer_pages,
+    "pypdfium2": _pypdfium2_pages,
+}
+
+
+def _extract_pdf_range(file_path: str, backend: str, first: int, last: int) -> List[Tuple[int, str]]:
+    """Extract pages [first, last) and number them from 1."""
+    texts = _PDF_READERS[backend](file_path, first, last)
+    return [(first + i + 1, text) for i, text in enumerate(texts)]
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Shared worker pool, created on first use and reused across files.
+
+    Workers are spawned rather than forked, so they never inherit the
+    threads of a running GUI or model. Each worker re-imports the entry
+    script as __mp_main__ (its module-level code runs, its
+    ``if __name__ == "__main__"`` block does not), so entry scripts and the
+    modules they import keep heavy libraries out of module level.
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown()
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _pool_workers = workers
+        return _pool
+
+
+@atexit.register
+def shutdown_pdf_pool():
+    """Stop the shared PDF worker pool, if one was started."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def extract_pdf_pages(file_path: str, backend: str = "pdfplumber",
+                      workers: int = 1) -> List[Tuple[int, str]]:
+    """
+    Extract text per page, optionally splitting large PDFs into page ranges
+    across a process pool.
+
+    Args:
+        file_path: Path to the PDF file
+        backend: One of PDF_BACKENDS
+        workers: Worker processes (default 1, in-process; 0 or None uses
+            the CPU count). Each worker is a separate Python process, so
+            only raise this on machines with memory to spare.
+
+    Returns:
+        (page number, text) tuples in page order, numbered from 1
+    """
+    if backend not in _PDF_READERS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+    if backend == "pypdfium2" and pypdfium2 is None:
+        raise ValueError("PDF backend pypdfium2 is not installed")
+
+    page_count = pdf_page_count(file_path)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or page_count < PARALLEL_MIN_PAGES:
+        return _extract_pdf_range(file_path, backend, 0, page_count)
+
+    ranges = [(first, min(first + PAGES_PER_TASK, page_count))
+              for first in range(0, page_count, PAGES_PER_TASK)]
+    pool = _get_pool(workers)
+    futures = [pool.submit(_extract_pdf_range, file_path, backend, first, last)
+               for first, last in ranges]
+    pages = []
+    # Collected in submission order, so pages stay in order
+    for future in futures:
+        pages.extend(future.result())
+    return pages
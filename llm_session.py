@@ -0,0 +1,159 @@
+"""
+Reusable instruction-prefix session for GPT4All.
+Evaluates the fixed instruction prefix once, keeps it in the model's
+context (KV state), and rolls the context back to the end of the prefix
+before each question so only the context and question are evaluated.
+"""
+
+import weakref
+from typing import Callable, Optional
+
+
+class GPT4AllBackend:
+    """
+    Adapter over GPT4All's low-level model (``GPT4All.model``, a
+    pyllmodel.LLModel) exposing the prompt context position.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.recalculated = False
+
+        # The C library reports context recalculation (after the context
+        # window fills up and is partly erased) through this hook; the
+        # prefix is no longer intact afterwards
+        self._own_callback = "_recalculate_callback" in vars(model)
+        self._original_callback = model._recalculate_callback
+
+        def on_recalculate(is_recalculating):
+            self.recalculated = True
+            return self._original_callback(is_recalculating)
+
+        model._recalculate_callback = on_recalculate
+
+    def detach(self):
+        """Restore the model's own recalculation hook and drop the model."""
+        if self.model is None:
+            return
+        if self._own_callback:
+            self.model._recalculate_callback = self._original_callback
+        else:
+            del self.model._recalculate_callback
+        self.model = None
+        self._original_callback = None
+
+    @staticmethod
+    def supports(llm) -> bool:
+        model = getattr(llm, "model", None)
+        return (model is not None and hasattr(model, "prompt_model")
+                and hasattr(model, "context") and hasattr(model, "_recalculate_callback"))
+
+    @property
+    def n_past(self) -> int:
+        """Tokens currently held in the model's context."""
+        context = self.model.context
+        return context.n_past if context is not None else 0
+
+    @n_past.setter
+    def n_past(self, value: int):
+        self.model.context.n_past = value
+
+    def prompt(self, text: str, n_predict: int, reset: bool,
+               callback: Callable[[int, str], bool], **sampling):
+        """Evaluate text after the current context and generate up to n_predict tokens."""
+        self.model.prompt_model(text, n_predict=n_predict, reset_context=reset,
+                                callback=callback, **sampling)
+
+
+def _stop(token_id: int, response: str) -> bool:
+    return False
+
+
+class PrefixSession:
+    def __init__(self, prefix: str):
+        """
+        Keep a fixed prompt prefix evaluated in a model's context.
+
+        Args:
+            prefix: Text every prompt starts with
+        """
+        self.prefix = prefix
+        self.prefix_tokens = 0
+        self._backend: Optional[GPT4AllBackend] = None
+        self._llm = None
+        self._expected_n_past = None
+
+    @staticmethod
+    def supports(llm) -> bool:
+        """Whether the model exposes the context needed for prefix reuse."""
+        return GPT4AllBackend.supports(llm)
+
+    def reset(self):
+        """Forget the cached prefix; the next question evaluates it again."""
+        self._expected_n_past = None
+        self.prefix_tokens = 0
+
+    def release(self):
+        """
+        Drop every reference to the model, e.g. when it is unloaded, so its
+        weights can be freed.
+        """
+        self.reset()
+        if self._backend is not None:
+            self._backend.detach()
+        self._backend = None
+        self._llm = None
+
+    def _is_primed(self, llm) -> bool:
+        if self._expected_n_past is None or self._llm is None or self._llm() is not llm:
+            return False
+        # Anything else that prompted the model (a plain generate() call, or
+        # a context recalculation) has overwritten the cached prefix
+        return (not self._backend.recalculated
+                and self._backend.n_past == self._expected_n_past)
+
+    def _prime(self, llm):
+        self.reset()
+        if self._llm is None or self._llm() is not llm:
+            self.release()
+            self._backend = GPT4AllBackend(llm.model)
+            self._llm = weakref.ref(llm)
+        backend = self._backend
+        backend.recalculated = False
+        backend.prompt(self.prefix, n_predict=0, reset=True, callback=_stop)
+        self.prefix_tokens = backend.n_past
+        self._expected_n_past = backend.n_past
+
+    def generate(self, llm, text: str, max_tokens: int,
+                 callback: Callable[[int, str], bool], **sampling) -> bool:
+        """
+        Generate a continuation of prefix + text.
+
+        Rolls the context back to the end of the prefix first, so nothing
+        from an earlier question stays visible to the model.
+
+        Args:
+            llm: GPT4All model (caller must hold it exclusively)
+            text: Prompt text following the prefix
+            max_tokens: Generation budget
+            callback: GPT4All token callback; returning False stops
+            **sampling: temp, top_k, top_p and other sampling parameters
+
+        Returns:
+            True if the cached prefix was reused, False if it was evaluated
+            in this call
+        """
+        reused = self._is_primed(llm)
+        if not reused:
+            self._prime(llm)
+
+        backend = self._backend
+        backend.n_past = self.prefix_tokens
+        try:
+            backend.prompt(text, n_predict=max_tokens, reset=False,
+                           callback=callback, **sampling)
+        except Exception:
+            self.reset()
+            raise
+        self._expected_n_past = backend.n_past
+        return reused
@@ -3,17 +3,88 @@ Question-answering engine using ChromaDB retrieval and GPT4All.
 Strictly answers from document context only.
 """
 
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
-from gpt4all import GPT4All
-from typing import List, Dict, Optional
+import re
+import time
+import asyncio
+import weakref
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+from resource_manager import ResourceManager
+from llm_session import PrefixSession
+from question_bank import BANK_COLLECTION, lookup_answer
+from retrieval import (CENTROID_COLLECTION, DEFAULT_COARSE_SECTIONS,
+                       flat_search, two_stage_search)
+from embed_store import load_embedder
+
+# The model libraries load on first use, like in embed_store
+if TYPE_CHECKING:
+    from gpt4all import GPT4All
+    from sentence_transformers import SentenceTransformer
+
+
+NOT_FOUND_MESSAGE = "Answer not found in the provided exam materials."
+CANCELLED_MESSAGE = "Generation cancelled."
+
+# Generation stops as soon as the model starts one of these
+STOP_SEQUENCES = ["\nQuestion:", "\nContext:"]
+
+# max_tokens by question type
+SHORT_ANSWER_TOKENS = 120
+LIST_ANSWER_TOKENS = 200
+LONG_ANSWER_TOKENS = 300
+
+# Fixed start of every prompt; evaluated once per model in session mode
+INSTRUCTION_PREFIX = f"""You are an exam assistant. Answer the question using ONLY the information provided in the context below. If the answer cannot be found in the context, respond with exactly: "{NOT_FOUND_MESSAGE}"
+
+Context:
+"""
+
+_LONG_QUESTION = re.compile(r"^(explain|describe|discuss|compare|why|how (does|do|is|are|can))\b|difference between")
+_LIST_QUESTION = re.compile(r"^(list|name|enumerate|what are|which are|give)\b|\b(features|types|examples|advantages|steps)\b")
+
+
+def is_not_found_answer(text: str) -> bool:
+    """Whether generated text is the not-found sentinel, quoted or not."""
+    return text.lstrip(" \t\r\n\"'“”").startswith("Answer not found")
+
+
+def max_tokens_for_question(question: str) -> int:
+    """
+    Pick a generation budget from the question type: explanations get the
+    most tokens, lists fewer, and short factual questions (who/when/what is)
+    the least.
+    """
+    q = question.strip().lower()
+    if _LONG_QUESTION.search(q):
+        return LONG_ANSWER_TOKENS
+    if _LIST_QUESTION.search(q):
+        return LIST_ANSWER_TOKENS
+    return SHORT_ANSWER_TOKENS
+
+
+class CancelToken:
+    """Thread-safe flag checked by the generation loop between tokens."""
+    
+    def __init__(self):
+        self._event = threading.Event()
+    
+    def cancel(self):
+        self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
 
 
 class QAEngine:
     def __init__(self, db_path: str = "./chroma_db", 
                  model_name: str = "all-MiniLM-L6-v2",
-                 gpt4all_model: str = "ggml-gpt4all-j-v1.3-groovy.bin"):
+                 gpt4all_model: str = "ggml-gpt4all-j-v1.3-groovy.bin",
+                 resources: ResourceManager = None,
+                 async_workers: int = 4,
+                 prefix_session: bool = False,
+                 retrieval_strategy: str = "flat"):
         """
         Initialize QA engine with ChromaDB and GPT4All.
         
@@ -21,11 +92,32 @@ class QAEngine:
             db_path: Path to ChromaDB data
             model_name: SentenceTransformer model name
             gpt4all_model: GPT4All model filename
+            resources: Shared ResourceManager; pass the DocumentStore's manager
+                so both use one embedder. Models load lazily through it.
+            async_workers: Threads running embedding and ChromaDB calls for
+                answer_question_async
+            prefix_session: Keep the instruction prefix evaluated in the
+                model's context between questions (falls back to full
+                prompts if the GPT4All bindings do not expose the context).
+                Experimental: it rewinds the bindings' context position,
+                so compare it with `python benchmark.py generation` on
+                your model before enabling it
+            retrieval_strategy: Default strategy for retrieve_context and
+                the answer_question pipelines ("flat" or "two_stage"; the
+                latter needs a DocumentStore with build_centroids)
         """
-        self.embedding_model = SentenceTransformer(model_name)
+        self.resources = resources or ResourceManager(idle_timeout=0)
+        self.retrieval_strategy = retrieval_strategy
+        self._embedder_key = f"embedder:{model_name}"
+        self.resources.register(self._embedder_key,
+                                lambda: load_embedder(model_name),
+                                label="Embedder")
         
         # Connect to ChromaDB
+        import chromadb
+        from chromadb.config import Settings
         self.client = chromadb.Client(Settings(
+            is_persistent=True,
             persist_directory=db_path,
             anonymized_telemetry=False
         ))
@@ -35,28 +127,81 @@ class QAEngine:
         except:
             self.collection = None
         
-        # Initialize GPT4All
-        self.llm = None
+        # Register GPT4All; it is loaded on first use
         self.gpt4all_model = gpt4all_model
-        self._load_llm()
+        self.resources.register("llm", self._load_llm, label="LLM")
+        
+        # GPT4All is not thread-safe: one generation at a time, from any caller
+        self._llm_lock = threading.Lock()
+        self.prefix_session = prefix_session
+        self._session = PrefixSession(INSTRUCTION_PREFIX)
+        # The session holds the low-level model; let it go when the LLM is unloaded
+        self.resources.on_unload("llm", self._session.release)
+        
+        # Executors for the async API, created on first use
+        self.async_workers = async_workers
+        self._retrieval_executor = None
+        self._llm_executor = None
+        self._executor_lock = threading.Lock()
+        self._llm_slots = weakref.WeakKeyDictionary()
+    
+    @property
+    def embedding_model(self) -> "SentenceTransformer":
+        """Embedding model, reloaded on demand if it was unloaded."""
+        return self.resources.get(self._embedder_key)
     
-    def _load_llm(self):
+    @property
+    def llm(self) -> Optional["GPT4All"]:
+        """GPT4All model, reloaded on demand if it was unloaded."""
+        return self.resources.get("llm")
+    
+    def _load_llm(self) -> Optional["GPT4All"]:
         """Load GPT4All model."""
         try:
-            self.llm = GPT4All(self.gpt4all_model)
+            from gpt4all import GPT4All
+            llm = GPT4All(self.gpt4all_model)
             print(f"GPT4All model loaded: {self.gpt4all_model}")
+            return llm
         except Exception as e:
             print(f"Error loading GPT4All model: {e}")
             print("Please ensure the model file is in the correct location.")
-            self.llm = None
+            return None
+    
+    def _centroid_collection(self):
+        """Section centroid collection, or None if documents predate it."""
+        try:
+            centroids = self.client.get_collection(CENTROID_COLLECTION)
+        except Exception:
+            return None
+        return centroids if centroids.count() else None
+    
+    def embed_question(self, question: str) -> List[float]:
+        """Embed a question with the shared embedding model."""
+        with self.resources.use(self._embedder_key) as embedder:
+            return embedder.encode([question])[0].tolist()
+    
+    def _bank_collection(self):
+        """Pre-answered question bank, or None if it has not been built."""
+        try:
+            return self.client.get_collection(BANK_COLLECTION)
+        except Exception:
+            return None
     
-    def retrieve_context(self, question: str, top_k: int = 3) -> List[Dict]:
+    def retrieve_context(self, question: str, top_k: int = 3,
+                         strategy: Optional[str] = None,
+                         coarse_sections: int = DEFAULT_COARSE_SECTIONS,
+                         question_embedding: Optional[List[float]] = None) -> List[Dict]:
         """
         Retrieve most relevant document chunks for the question.
         
         Args:
             question: User's question
             top_k: Number of top results to retrieve
+            strategy: "flat" searches every chunk through the HNSW index;
+                "two_stage" first picks the closest sections by centroid and
+                ranks only their chunks exactly (default: retrieval_strategy)
+            coarse_sections: Sections searched in the second stage
+            question_embedding: Precomputed question embedding
         
         Returns:
             List of relevant document chunks with metadata
@@ -65,86 +210,154 @@ class QAEngine:
             return []
         
         # Generate question embedding
-        question_embedding = self.embedding_model.encode([question])[0]
+        if question_embedding is None:
+            question_embedding = self.embed_question(question)
+        
+        if (strategy or self.retrieval_strategy) == "two_stage":
+            centroids = self._centroid_collection()
+            if centroids is not None:
+                contexts = two_stage_search(self.collection, centroids, question_embedding,
+                                            top_k, coarse_sections)
+                if len(contexts) >= top_k:
+                    return contexts
         
         # Query ChromaDB
-        results = self.collection.query(
-            query_embeddings=[question_embedding.tolist()],
-            n_results=top_k
-        )
-        
-        # Format results
-        contexts = []
-        if results['documents'] and results['documents'][0]:
-            for i, doc in enumerate(results['documents'][0]):
-                contexts.append({
-                    'text': doc,
-                    'source': results['metadatas'][0][i].get('source', 'Unknown'),
-                    'distance': results['distances'][0][i] if 'distances' in results else None
-                })
-        
-        return contexts
-    
-    def generate_answer(self, question: str, contexts: List[Dict]) -> str:
+        return flat_search(self.collection, question_embedding, top_k)
+    
+    def generate_answer(self, question: str, contexts: List[Dict],
+                        cancel_token: Optional[CancelToken] = None,
+                        max_tokens: Optional[int] = None,
+                        early_stop: bool = True) -> str:
         """
         Generate answer using GPT4All based strictly on retrieved context.
         
         Args:
             question: User's question
             contexts: Retrieved document contexts
+            cancel_token: Optional token; cancelling it stops generation
+                at the next token
+            max_tokens: Generation budget (default: chosen from question type)
+            early_stop: Stop on the not-found sentinel or a stop sequence
         
         Returns:
             Generated answer or "Answer not found" message
         """
-        if not self.llm:
-            return "Error: Language model not loaded. Please check GPT4All installation."
+        answer, _ = self._generate(question, contexts, cancel_token, max_tokens, early_stop)
+        return answer
+    
+    def _generate(self, question: str, contexts: List[Dict],
+                  cancel_token: Optional[CancelToken] = None,
+                  max_tokens: Optional[int] = None,
+                  early_stop: bool = True) -> Tuple[str, Dict]:
+        """Generate an answer and return it with generation statistics."""
+        stats = {'tokens': 0, 'latency': 0.0, 'prompt_eval': None, 'prefix_reused': False,
+                 'max_tokens': 0, 'stop_reason': None}
         
         if not contexts:
-            return "Answer not found in the provided exam materials."
+            return NOT_FOUND_MESSAGE, stats
+        
+        if max_tokens is None:
+            max_tokens = max_tokens_for_question(question)
+        stats['max_tokens'] = max_tokens
         
         # Combine contexts
         context_text = "\n\n".join([ctx['text'] for ctx in contexts])
         
         # Create strict prompt
-        prompt = f"""You are an exam assistant. Answer the question using ONLY the information provided in the context below. If the answer cannot be found in the context, respond with exactly: "Answer not found in the provided exam materials."
+        question_prompt = f"""{context_text}
 
-Context:
-{context_text}
-
-Question: {questio
-n}"
+Question: {question}
 
 Answer:"""
         
-        # Generate answer with strict parameters
-        try:
-            response = self.llm.generate(
-                prompt,
-                max_tokens=300,
-                temp=0.1,  # Low temperature for factual responses
-                top_k=1,
-                top_p=0.1
-            )
-            
-            answer = response.strip()
-            
-            # Validate answer quality
-            if not answer or len(answer) < 10:
-                return "Answer not found in the provided exam materials."
-            
-            return answer
+        output = []
+        
+        def on_token(token_id: int, response: str) -> bool:
+            if stats['prompt_eval'] is None:
+                # Time to first token: dominated by prompt evaluation
+                stats['prompt_eval'] = time.time() - start
+            # Returning False stops generation inside GPT4All
+            if cancel_token is not None and cancel_token.cancelled:
+                stats['stop_reason'] = 'cancelled'
+                return False
+            output.append(response)
+            stats['tokens'] += 1
+            if not early_stop:
+                return True
+            text = "".join(output)
+            if is_not_found_answer(text):
+                stats['stop_reason'] = 'not_found'
+                return False
+            if any(stop in text for stop in STOP_SEQUENCES):
+                stats['stop_reason'] = 'stop_sequence'
+                return False
+            return True
+        
+        with self._llm_lock, self.resources.use("llm") as llm:
+            if not llm:
+                return "Error: Language model not loaded. Please check GPT4All installation.", stats
             
-        except Exception as e:
-            print(f"Error generating answer: {e}")
-            return "Error generating answer. Please try again."
+            # Generate answer with strict parameters
+            start = time.time()
+            try:
+                if self.prefix_session and self._session.supports(llm):
+                    stats['prefix_reused'] = self._session.generate(
+                        llm,
+                        question_prompt,
+                        max_tokens=max_tokens,
+                        temp=0.1,
+                        top_k=1,
+                        top_p=0.1,
+                        # GPT4All.generate defaults; prompt_model's differ
+                        repeat_penalty=1.18,
+                        repeat_last_n=64,
+                        callback=on_token
+                    )
+                else:
+                    llm.generate(
+                        INSTRUCTION_PREFIX + question_prompt,
+                        max_tokens=max_tokens,
+                        temp=0.1,  # Low temperature for factual responses
+                        top_k=1,
+                        top_p=0.1,
+                        callback=on_token
+                    )
+            except Exception as e:
+                print(f"Error generating answer: {e}")
+                return "Error generating answer. Please try again.", stats
+            finally:
+                stats['latency'] = time.time() - start
+        
+        if stats['stop_reason'] == 'cancelled':
+            return CANCELLED_MESSAGE, stats
+        if stats['stop_reason'] == 'not_found':
+            return NOT_FOUND_MESSAGE, stats
+        if stats['stop_reason'] is None and stats['tokens'] >= max_tokens:
+            stats['stop_reason'] = 'max_tokens'
+        
+        answer = "".join(output)
+        for stop in STOP_SEQUENCES:
+            answer = answer.split(stop)[0]
+        answer = answer.strip()
+        
+        # Validate answer quality
+        if not answer or len(answer) < 10 or is_not_found_answer(answer):
+            return NOT_FOUND_MESSAGE, stats
+        
+        return answer, stats
     
-    def answer_question(self, question: str, top_k: int = 3) -> Dict:
+    def answer_question(self, question: str, top_k: int = 3,
+                        cancel_token: Optional[CancelToken] = None,
+                        use_bank: bool = True) -> Dict:
         """
         Complete QA pipeline: retrieve context and generate answer.
         
         Args:
             question: User's question
             top_k: Number of context chunks to retrieve
+            cancel_token: Optional token to abort generation
+            use_bank: Serve a close match from the pre-answered question
+                bank instead of generating
         
         Returns:
             Dictionary with answer and metadata
@@ -156,24 +369,159 @@ Answer:"""
                 'sources': []
             }
         
+        question_embedding = self.embed_question(question)
+        
+        if use_bank:
+            banked = self._banked_result(question_embedding)
+            if banked:
+                return banked
+        
         # Retrieve relevant contexts
-        contexts = self.retrieve_context(question, top_k)
+        contexts = self.retrieve_context(question, top_k,
+                                         question_embedding=question_embedding)
+        
+        early = self._early_result(contexts, cancel_token)
+        if early:
+            return early
         
+        # Generate answer
+        answer, stats = self._generate(question, contexts, cancel_token)
+        
+        return self._answer_result(answer, contexts, stats)
+    
+    def _banked_result(self, question_embedding: List[float]) -> Optional[Dict]:
+        """Result for a close match in the question bank, if there is one."""
+        banked = lookup_answer(self._bank_collection(), question_embedding)
+        if not banked:
+            return None
+        return {
+            'answer': banked['answer'],
+            'contexts': [],
+            'sources': banked['sources'],
+            'from_bank': True
+        }
+    
+    def _early_result(self, contexts: List[Dict],
+                      cancel_token: Optional[CancelToken]) -> Optional[Dict]:
+        """Result when generation is skipped: no context, or already cancelled."""
         if not contexts:
             return {
-                'answer': "Answer not found in the provided exam materials.",
+                'answer': NOT_FOUND_MESSAGE,
                 'contexts': [],
                 'sources': []
             }
         
-        # Generate answer
-        answer = self.generate_answer(question, contexts)
-        
+        if cancel_token is not None and cancel_token.cancelled:
+            return {
+                'answer': CANCELLED_MESSAGE,
+                'contexts': contexts,
+                'sources': [],
+                'cancelled': True
+            }
+        return None
+    
+    def _answer_result(self, answer: str, contexts: List[Dict], stats: Dict) -> Dict:
         # Extract unique sources
         sources = list(set([ctx['source'] for ctx in contexts]))
         
         return {
             'answer': answer,
             'contexts': contexts,
-            'sources': sources
+            'sources': sources,
+            'stats': stats,
+            'cancelled': stats['stop_reason'] == 'cancelled'
         }
+    
+    def _executors(self) -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+        """Thread pools for retrieval and for the single LLM worker."""
+        with self._executor_lock:
+            if self._retrieval_executor is None:
+                self._retrieval_executor = ThreadPoolExecutor(
+                    max_workers=self.async_workers, thread_name_prefix="qa-retrieval")
+                self._llm_executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="qa-llm")
+        return self._retrieval_executor, self._llm_executor
+    
+    def close(self):
+        """Stop the async API's worker threads; they restart on next use."""
+        with self._executor_lock:
+            executors = (self._retrieval_executor, self._llm_executor)
+            self._retrieval_executor = None
+            self._llm_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=True)
+    
+    def _llm_slot(self) -> asyncio.Semaphore:
+        """Semaphore admitting one generation at a time on the running loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._llm_slots:
+            self._llm_slots[loop] = asyncio.Semaphore(1)
+        return self._llm_slots[loop]
+    
+    async def answer_question_async(self, question: str, top_k: int = 3,
+                                    cancel_token: Optional[CancelToken] = None,
+                                    use_bank: bool = True) -> Dict:
+        """
+        Asyncio version of answer_question.
+        
+        Embedding, the question bank lookup and ChromaDB retrieval run in a
+        thread pool, so asyncio.gather over many questions overlaps their
+        retrieval. Generation is serialized: one question at a time holds
+        the LLM, the rest wait on a semaphore without occupying threads.
+        
+        Cancelling the task stops generation at the next token (the same
+        way cancel_token does) and releases the LLM once it has stopped.
+        
+        Args:
+            question: User's question
+            top_k: Number of context chunks to retrieve
+            cancel_token: Optional token to abort generation
+            use_bank: Serve a close match from the pre-answered question
+                bank instead of generating
+        
+        Returns:
+            Dictionary with answer and metadata, as answer_question
+        """
+        if not question or not question.strip():
+            return {
+                'answer': "Please provide a valid question.",
+                'contexts': [],
+                'sources': []
+            }
+        
+        loop = asyncio.get_running_loop()
+        retrieval_executor, llm_executor = self._executors()
+        
+        question_embedding = await loop.run_in_executor(
+            retrieval_executor, self.embed_question, question)
+        
+        if use_bank:
+            banked = await loop.run_in_executor(
+                retrieval_executor, self._banked_result, question_embedding)
+            if banked:
+                return banked
+        
+        contexts = await loop.run_in_executor(
+            retrieval_executor,
+            lambda: self.retrieve_context(question, top_k,
+                                          question_embedding=question_embedding))
+        
+        early = self._early_result(contexts, cancel_token)
+        if early:
+            return early
+        
+        cancel_token = cancel_token or CancelToken()
+        async with self._llm_slot():
+            generation = loop.run_in_executor(
+                llm_executor, self._generate, question, contexts, cancel_token)
+            try:
+                # Shielded so cancellation reaches the model through the token
+                answer, stats = await asyncio.shield(generation)
+            except asyncio.CancelledError:
+                cancel_token.cancel()
+                # Hold the LLM slot until the worker has actually stopped
+                await asyncio.wait([generation])
+                raise
+        
+        return self._answer_result(answer, contexts, stats)
@@ -0,0 +1,276 @@
+"""
+Offline bank of pre-answered exam questions.
+Generates likely questions from stored chunks, answers them with QAEngine
+off-peak, and serves close matches instantly at question time.
+
+Usage:
+    python question_bank.py [--db ./chroma_db] [--limit N]
+"""
+
+import os
+import re
+import json
+import argparse
+import hashlib
+from typing import Callable, Dict, List, Optional
+
+from atomic_io import write_json
+
+
+BANK_COLLECTION = "exam_question_bank"
+
+# Cosine distance below which a live question reuses a banked answer
+BANK_MATCH_DISTANCE = 0.1
+
+# Questions generated per chunk at most
+MAX_QUESTIONS_PER_CHUNK = 5
+
+# Prefix of the metadata flags marking every document an answer drew on
+_PATH_KEY_PREFIX = "cites_"
+
+_SUBJECT = r"([A-Z][\w \-()]{1,60}?)"
+_DEFINITION = re.compile(r"^" + _SUBJECT + r" (is (?:a|an|the)|are) ", re.MULTILINE)
+_CREATOR = re.compile(r"^" + _SUBJECT + r" (?:was|were) "
+                      r"(created|invented|developed|founded|discovered|designed) by ", re.MULTILINE)
+_DATE = re.compile(r"^" + _SUBJECT + r" (?:was|were) (first )?"
+                   r"(released|founded|established|introduced|published|invented) in \d{3,4}", re.MULTILINE)
+_LIST_HEADER = re.compile(r"^([A-Z][\w \-()]{2,40}):[ \t]*\n\s*(?:[-•*]|\d+[.)])", re.MULTILINE)
+
+# Sentences starting with these refer back to something the chunk may not name
+_PRONOUNS = {"it", "they", "this", "these", "that", "those", "he", "she", "we"}
+
+
+def _path_key(file_path: str) -> str:
+    """Metadata key flagging banked answers that drew on a document."""
+    return _PATH_KEY_PREFIX + hashlib.md5(file_path.encode('utf-8')).hexdigest()
+
+
+def _subject(text: str) -> str:
+    """Lower-case a sentence subject unless it looks like a proper name."""
+    words = text.strip().split()
+    if len(words) > 1 and not words[1][:1].isupper():
+        words[0] = words[0].lower()
+    return " ".join(words)
+
+
+def generate_questions(chunk: str) -> List[str]:
+    """
+    Generate likely exam questions from a chunk: definitions, creators,
+    dates and bulleted lists.
+    """
+    questions = []
+    for match in _DEFINITION.finditer(chunk):
+        verb = "is" if match.group(2).startswith("is") else "are"
+        questions.append((match.group(1), f"What {verb} {_subject(match.group(1))}?"))
+    for match in _CREATOR.finditer(chunk):
+        questions.append((match.group(1), f"Who {match.group(2)} {_subject(match.group(1))}?"))
+    for match in _DATE.finditer(chunk):
+        verb = "were" if match.group(1).rstrip().endswith("s") else "was"
+        first = match.group(2) or ""
+        questions.append((match.group(1),
+                          f"When {verb} {_subject(match.group(1))} {first}{match.group(3)}?"))
+    for match in _LIST_HEADER.finditer(chunk):
+        header = match.group(1)
+        # "Python is widely used in:" is a sentence, not a list title
+        if re.search(r"\b(is|are|was|were)\b", header):
+            continue
+        questions.append((header, f"What are the {header.strip().lower()}?"))
+
+    questions = [q for subject, q in questions
+                 if subject.split()[0].lower() not in _PRONOUNS]
+
+    # Keep order, drop duplicates
+    return list(dict.fromkeys(questions))[:MAX_QUESTIONS_PER_CHUNK]
+
+
+def lookup_answer(collection, question_embedding: List[float],
+                  max_distance: float = BANK_MATCH_DISTANCE) -> Optional[Dict]:
+    """
+    Find a banked answer for a question embedding.
+
+    Returns:
+        Dictionary with question, answer, sources and distance, or None if
+        no banked question is close enough
+    """
+    if collection is None or not collection.count():
+        return None
+    results = collection.query(query_embeddings=[question_embedding], n_results=1)
+    if not results['ids'] or not results['ids'][0]:
+        return None
+    distance = results['distances'][0][0]
+    if distance > max_distance:
+        return None
+    metadata = results['metadatas'][0][0]
+    return {
+        'question': results['documents'][0][0],
+        'answer': metadata['answer'],
+        'sources': json.loads(metadata['sources']),
+        'distance': distance
+    }
+
+
+class QuestionBank:
+    def __init__(self, client, db_path: str = "./chroma_db"):
+        """
+        Open the question bank stored alongside the document collection.
+
+        Args:
+            client: ChromaDB client shared with DocumentStore/QAEngine
+            db_path: Path to ChromaDB data (holds the build progress file)
+        """
+        self.client = client
+        self.collection = client.get_or_create_collection(
+            name=BANK_COLLECTION,
+            metadata={"hnsw:space": "cosine"}
+        )
+        self.progress_path = os.path.join(db_path, "question_bank_progress.json")
+        self.progress: Dict[str, str] = {}
+        if os.path.exists(self.progress_path):
+            with open(self.progress_path, 'r', encoding='utf-8') as f:
+                self.progress = json.load(f)
+
+    def _save_progress(self):
+        write_json(self.progress_path, self.progress)
+
+    def _iter_chunks(self, page_size: int = 1000):
+        """Yield (chunk hash, text, metadata) for every stored chunk."""
+        collection = self.client.get_collection("exam_documents")
+        offset = 0
+        while True:
+            page = collection.get(include=["documents", "metadatas"],
+                                  limit=page_size, offset=offset)
+            if not page['ids']:
+                break
+            for text, metadata in zip(page['documents'], page['metadatas']):
+                key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+                yield key, text, metadata
+            offset += len(page['ids'])
+
+    def build(self, qa_engine, limit: Optional[int] = None,
+              progress: Callable[[str], None] = print) -> Dict:
+        """
+        Generate and answer questions for chunks not processed yet.
+
+        Progress is saved after every chunk, so an interrupted build resumes
+        where it stopped. Chunks are tracked by text hash, so edited
+        documents are picked up again.
+
+        Args:
+            qa_engine: QAEngine used to answer the generated questions
+            limit: Stop after this many chunks (for bounded off-peak runs)
+            progress: Callback receiving progress lines
+
+        Returns:
+            Dictionary with statistics for this run
+        """
+        from qa_engine import is_not_found_answer
+
+        processed = 0
+        banked = 0
+        for key, text, metadata in self._iter_chunks():
+            if key in self.progress:
+                continue
+            if limit is not None and processed >= limit:
+                break
+
+            for question in generate_questions(text):
+                result = qa_engine.answer_question(question, use_bank=False)
+                answer = result['answer']
+                if is_not_found_answer(answer) or not result.get('stats') \
+                        or result['stats']['stop_reason'] == 'cancelled' \
+                        or answer.startswith("Error"):
+                    continue
+                # The answer can quote any retrieved context, not only the
+                # chunk the question came from
+                paths = {metadata.get("path", "")}
+                paths.update(ctx['path'] for ctx in result.get('contexts', []) if ctx.get('path'))
+                entry = {"answer": answer,
+                         "sources": json.dumps(result['sources']),
+                         "path": metadata.get("path", ""),
+                         "paths": json.dumps(sorted(p for p in paths if p)),
+                         "chunk": key}
+                entry.update({_path_key(p): 1 for p in paths if p})
+                self.collection.upsert(
+                    ids=[hashlib.sha1(question.encode('utf-8')).hexdigest()[:16]],
+                    embeddings=[qa_engine.embed_question(question)],
+                    documents=[question],
+                    metadatas=[entry]
+                )
+                banked += 1
+
+            self.progress[key] = metadata.get("path", "")
+            self._save_progress()
+            processed += 1
+            progress(f"[{processed}] {banked} questions banked")
+
+        return {"processed_chunks": processed, "banked_questions": banked}
+
+    def coverage(self) -> Dict:
+        """
+        Get bank coverage of the current collection.
+
+        Returns:
+            Total chunks, chunks processed, chunks with at least one banked
+            question, and the number of banked questions
+        """
+        banked_chunks = {m['chunk'] for m in self.collection.get(include=["metadatas"])['metadatas']}
+        total = processed = covered = 0
+        for key, _, _ in self._iter_chunks():
+            total += 1
+            processed += key in self.progress
+            covered += key in banked_chunks
+        return {
+            "total_chunks": total,
+            "processed_chunks": processed,
+            "covered_chunks": covered,
+            "questions": self.collection.count()
+        }
+
+    def forget(self, file_path: str):
+        """Drop banked answers generated from or citing one source, and its progress."""
+        self.collection.delete(where={"path": file_path})
+        self.collection.delete(where={_path_key(file_path): 1})
+        self.progress = {k: p for k, p in self.progress.items() if p != file_path}
+        self._save_progress()
+
+    def clear(self):
+        """Remove every banked answer and all build progress."""
+        self.client.delete_collection(BANK_COLLECTION)
+        self.collection = self.client.get_or_create_collection(
+            name=BANK_COLLECTION,
+            metadata={"hnsw:space": "cosine"}
+        )
+        self.progress = {}
+        self._save_progress()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-answer likely exam questions.")
+    parser.add_argument("--db", default="./chroma_db", help="ChromaDB path")
+    parser.add_argument("--limit", type=int, help="Process at most this many chunks")
+    parser.add_argument("--coverage", action="store_true", help="Only report coverage")
+    args = parser.parse_args()
+
+    from qa_engine import QAEngine
+    engine = QAEngine(db_path=args.db)
+    bank = QuestionBank(engine.client, args.db)
+
+    if not args.coverage:
+        try:
+            result = bank.build(engine, limit=args.limit)
+            print(f"\n✅ Processed {result['processed_chunks']} chunks, "
+                  f"banked {result['banked_questions']} questions")
+        except KeyboardInterrupt:
+            print("\nInterrupted - run again to resume")
+
+    stats = bank.coverage()
+    if stats['total_chunks']:
+        print(f"Coverage: {stats['covered_chunks']}/{stats['total_chunks']} chunks "
+              f"({100 * stats['covered_chunks'] / stats['total_chunks']:.1f}%) have banked answers, "
+              f"{stats['processed_chunks']} processed, {stats['questions']} questions in bank")
+    else:
+        print("No documents loaded")
+
+
+if __name__ == "__main__":
+    main()
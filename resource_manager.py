@@ -0,0 +1,220 @@
+"""
+Memory-budget manager for the models used by the exam QA system.
+Loads models on first use and unloads them when idle or under memory pressure.
+"""
+
+import gc
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def available_memory_mb() -> Optional[float]:
+    """Return available system memory in MB, or None if it cannot be read."""
+    if psutil is not None:
+        return psutil.virtual_memory().available / (1024 * 1024)
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def estimate_model_size_mb(model: Any) -> float:
+    """
+    Estimate the resident size of a model in MB.
+
+    Torch modules (SentenceTransformer) are measured from their parameters;
+    GPT4All models from their weights file on disk.
+    """
+    if hasattr(model, "parameters"):
+        total = 0
+        for param in model.parameters():
+            total += param.numel() * param.element_size()
+        return total / (1024 * 1024)
+
+    config = getattr(model, "config", None)
+    if isinstance(config, dict) and config.get("path") and os.path.exists(config["path"]):
+        return os.path.getsize(config["path"]) / (1024 * 1024)
+    return 0.0
+
+
+class _Component:
+    def __init__(self, name: str, loader: Callable[[], Any], label: str):
+        self.name = name
+        self.label = label
+        self.loader = loader
+        self.model = None
+        self.failed = False
+        self.size_mb = 0.0
+        self.last_used = 0.0
+        self.in_use = 0
+        self.unload_hooks: List[Callable[[], None]] = []
+        self.lock = threading.RLock()
+
+
+class ResourceManager:
+    def __init__(self, idle_timeout: float = 900, min_available_mb: float = 1024,
+                 on_status: Optional[Callable[[str], None]] = None):
+        """
+        Initialize resource manager.
+
+        Args:
+            idle_timeout: Seconds without use before a model is unloaded
+                (0 disables idle unloading)
+            min_available_mb: Unload idle models when free system memory
+                drops below this many MB
+            on_status: Optional callback receiving status messages such as
+                "warming up"; may be called from worker threads
+        """
+        self.idle_timeout = idle_timeout
+        self.min_available_mb = min_available_mb
+        self.on_status = on_status
+        self._components: Dict[str, _Component] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, loader: Callable[[], Any], label: Optional[str] = None):
+        """
+        Register a lazily loaded model.
+
+        Registering an existing name is a no-op so several owners can share
+        one model (e.g. the embedder used by DocumentStore and QAEngine).
+        """
+        with self._lock:
+            if name not in self._components:
+                self._components[name] = _Component(name, loader, label or name)
+
+    def on_unload(self, name: str, hook: Callable[[], None]):
+        """
+        Call hook whenever the model is unloaded, before it is released, so
+        owners of objects tied to the model can drop their references.
+        """
+        self._components[name].unload_hooks.append(hook)
+
+    def _status(self, message: str):
+        if self.on_status:
+            self.on_status(message)
+
+    def get(self, name: str) -> Any:
+        """
+        Return the model, loading it first if it is not resident.
+
+        A loader that returns None is not called again until reload(), so a
+        missing model file is not looked up (or downloaded) on every use.
+        """
+        component = self._components[name]
+        with component.lock:
+            if component.model is None and not component.failed:
+                self._status(f"Warming up {component.label}...")
+                start = time.time()
+                component.model = component.loader()
+                if component.model is not None:
+                    component.size_mb = estimate_model_size_mb(component.model)
+                    self._status(f"{component.label} ready ({time.time() - start:.1f}s)")
+                else:
+                    component.failed = True
+                    self._status(f"{component.label} failed to load")
+            component.last_used = time.time()
+            return component.model
+
+    @contextmanager
+    def use(self, name: str):
+        """Hold a model for the duration of a block so it is not unloaded."""
+        component = self._components[name]
+        with component.lock:
+            model = self.get(name)
+            component.in_use += 1
+        try:
+            yield model
+        finally:
+            with component.lock:
+                component.in_use -= 1
+                component.last_used = time.time()
+
+    def reload(self, name: str) -> Any:
+        """Forget an earlier load failure and load the model again."""
+        component = self._components[name]
+        with component.lock:
+            component.failed = False
+        self.unload(name)
+        return self.get(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return self._components[name].model is not None
+
+    def unload(self, name: str) -> bool:
+        """Drop the manager's reference to a model. Returns True if unloaded."""
+        component = self._components[name]
+        # Never wait on a model that is currently loading or generating
+        if not component.lock.acquire(blocking=False):
+            return False
+        try:
+            if component.model is None or component.in_use:
+                return False
+            for hook in component.unload_hooks:
+                hook()
+            component.model = None
+            component.size_mb = 0.0
+        finally:
+            component.lock.release()
+        gc.collect()
+        self._status(f"{component.label} unloaded")
+        return True
+
+    def check(self) -> List[str]:
+        """
+        Unload models that have been idle too long, or under memory pressure
+        unload idle models largest first until enough memory is free.
+
+        Returns:
+            Names of the components that were unloaded
+        """
+        unloaded = []
+        now = time.time()
+
+        if self.idle_timeout:
+            for name, component in list(self._components.items()):
+                if (component.model is not None and not component.in_use
+                        and now - component.last_used >= self.idle_timeout):
+                    if self.unload(name):
+                        unloaded.append(name)
+
+        available = available_memory_mb()
+        if available is not None and available < self.min_available_mb:
+            candidates = sorted(
+                (c for c in self._components.values() if c.model is not None),
+                key=lambda c: c.size_mb, reverse=True
+            )
+            for component in candidates:
+                if available >= self.min_available_mb:
+                    break
+                size_mb = component.size_mb
+                if self.unload(component.name):
+                    unloaded.append(component.name)
+                    available += size_mb
+
+        return unloaded
+
+    def usage(self) -> Dict[str, Dict]:
+        """Get per-component memory usage and idle time."""
+        now = time.time()
+        return {
+            name: {
+                'label': c.label,
+                'loaded': c.model is not None,
+                'failed': c.failed,
+                'size_mb': c.size_mb,
+                'idle_seconds': now - c.last_used if c.model is not None else None
+            }
+            for name, c in self._components.items()
+        }
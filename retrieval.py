@@ -0,0 +1,115 @@
+"""
+Chunk search over ChromaDB collections.
+Provides flat search and two-stage coarse-to-fine search, where section
+centroids pick candidate sections whose chunks are then fetched by ID and
+ranked exactly.
+"""
+
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+
+CENTROID_COLLECTION = "exam_document_centroids"
+
+# Consecutive chunks of one document that share a centroid
+SECTION_CHUNKS = 64
+
+# HNSW candidate list size for queries (Chroma's default of 10 loses
+# recall on large collections); applies to collections created with it
+SEARCH_EF = 100
+
+# Sections searched in the second stage
+DEFAULT_COARSE_SECTIONS = 20
+
+
+def section_id(doc_id: str, chunk_index: int) -> str:
+    return f"{doc_id}_s{chunk_index // SECTION_CHUNKS}"
+
+
+def section_chunk_ids(section: str) -> List[str]:
+    """Chunk IDs that can belong to a section (some may not exist)."""
+    doc_id, index = section.rsplit("_s", 1)
+    first = int(index) * SECTION_CHUNKS
+    return [f"{doc_id}_{i}" for i in range(first, first + SECTION_CHUNKS)]
+
+
+def section_centroids(section_ids: Sequence[str], embeddings: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Average normalized chunk embeddings per section.
+
+    Returns:
+        Unit-length centroid per section id
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.maximum(norms, 1e-12)
+
+    sums: Dict[str, np.ndarray] = {}
+    for sid, vector in zip(section_ids, embeddings):
+        if sid in sums:
+            sums[sid] += vector
+        else:
+            sums[sid] = vector.copy()
+    return {sid: v / max(np.linalg.norm(v), 1e-12) for sid, v in sums.items()}
+
+
+def _context(text: str, metadata: Dict, distance: Optional[float]) -> Dict:
+    return {
+        'text': text,
+        'source': metadata.get('source', 'Unknown'),
+        'path': metadata.get('path'),
+        'page': metadata.get('page'),
+        'distance': distance
+    }
+
+
+def _format_results(results: Dict) -> List[Dict]:
+    contexts = []
+    if results['documents'] and results['documents'][0]:
+        for i, doc in enumerate(results['documents'][0]):
+            distance = results['distances'][0][i] if 'distances' in results else None
+            contexts.append(_context(doc, results['metadatas'][0][i], distance))
+    return contexts
+
+
+def flat_search(collection, query_embedding: List[float], top_k: int) -> List[Dict]:
+    """Search every chunk in the collection."""
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=top_k
+    )
+    return _format_results(results)
+
+
+def two_stage_search(collection, centroids, query_embedding: List[float], top_k: int,
+                     coarse_sections: int = DEFAULT_COARSE_SECTIONS) -> List[Dict]:
+    """
+    Pick the closest sections by centroid, then rank only their chunks.
+
+    The chunks are fetched by ID and ranked by exact cosine distance, so the
+    second stage costs coarse_sections * SECTION_CHUNKS comparisons whatever
+    the collection size. Returns fewer than top_k results if the chosen
+    sections hold fewer chunks; callers may fall back to flat_search.
+    """
+    coarse = centroids.query(
+        query_embeddings=[query_embedding],
+        n_results=min(coarse_sections, centroids.count())
+    )
+    section_ids = coarse['ids'][0] if coarse['ids'] else []
+    if not section_ids:
+        return []
+
+    chunk_ids = [cid for sid in section_ids for cid in section_chunk_ids(sid)]
+    fetched = collection.get(ids=chunk_ids, include=["embeddings", "documents", "metadatas"])
+    if not fetched['ids']:
+        return []
+
+    embeddings = np.asarray(fetched['embeddings'], dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query /= max(np.linalg.norm(query), 1e-12)
+    distances = 1.0 - embeddings @ query
+
+    best = np.argsort(distances)[:top_k]
+    return [_context(fetched['documents'][i], fetched['metadatas'][i], float(distances[i]))
+            for i in best]
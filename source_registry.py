@@ -0,0 +1,119 @@
+"""
+Per-source registry of stored documents.
+Records how many chunks each source file has so one document can be
+removed or replaced without rebuilding the collection. Kept in SQLite so
+the GUI and bulk_index.py can update it at the same time.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+_COLUMNS = ("path", "source", "doc_id", "chunks", "tokens", "ingested_at")
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count (words and punctuation), independent of the embedder."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def chunk_ids(entry: Dict) -> List[str]:
+    """Chunk IDs of a registry entry (DocumentStore numbers them per document)."""
+    return [f"{entry['doc_id']}_{i}" for i in range(entry['chunks'])]
+
+
+class SourceRegistry:
+    def __init__(self, path: str, legacy_json: Optional[str] = None):
+        """
+        Open or create the registry database.
+
+        Every call reads and writes the database directly, so several
+        processes see each other's changes.
+
+        Args:
+            path: Registry database path, usually inside the ChromaDB folder
+            legacy_json: sources.json written by earlier versions; imported
+                once and renamed to sources.json.migrated
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None, timeout=60)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, "
+                                 "source TEXT, doc_id TEXT, chunks INTEGER, tokens INTEGER, "
+                                 "ingested_at REAL)")
+                if legacy_json and os.path.exists(legacy_json):
+                    self._import_json(legacy_json)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _import_json(self, legacy_json: str):
+        with open(legacy_json, 'r', encoding='utf-8') as f:
+            sources = json.load(f)
+        rows = []
+        for entry in sources.values():
+            if not entry["ids"]:
+                continue
+            doc_id = entry["ids"][0].rsplit("_", 1)[0]
+            rows.append((entry["path"], entry["source"], doc_id, len(entry["ids"]),
+                         entry["tokens"], entry["ingested_at"]))
+        self._db.executemany("INSERT OR IGNORE INTO sources VALUES (?, ?, ?, ?, ?, ?)", rows)
+        os.replace(legacy_json, legacy_json + ".migrated")
+
+    def _query(self, sql: str, params=()) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+    def __contains__(self, file_path: str) -> bool:
+        return self.get(file_path) is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+
+    def get(self, file_path: str) -> Optional[Dict]:
+        rows = self._query("SELECT * FROM sources WHERE path = ?", (file_path,))
+        return rows[0] if rows else None
+
+    def add(self, file_path: str, doc_id: str, chunks: List[str]) -> Dict:
+        """Record (or overwrite) the chunks stored for a source file."""
+        entry = {
+            "path": file_path,
+            "source": os.path.basename(file_path),
+            "doc_id": doc_id,
+            "chunks": len(chunks),
+            "tokens": sum(count_tokens(c) for c in chunks),
+            "ingested_at": time.time()
+        }
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?, ?, ?)",
+                             tuple(entry[c] for c in _COLUMNS))
+        return entry
+
+    def remove(self, file_path: str) -> Optional[Dict]:
+        entry = self.get(file_path)
+        with self._lock:
+            self._db.execute("DELETE FROM sources WHERE path = ?", (file_path,))
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM sources")
+
+    def entries(self) -> List[Dict]:
+        """All sources sorted by file name."""
+        return self._query("SELECT * FROM sources ORDER BY lower(source), path")
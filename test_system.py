@@ -4,8 +4,23 @@ Creates sample documents and tests the QA pipeline.
 """
 
 import os
+import time
+import threading
+import hashlib
 import tempfile
+import tracemalloc
+import zipfile
 from embed_store import DocumentStore
+from extractors import (iter_docx_blocks, PARAGRAPH, TABLE_CELL,
+                        available_pdf_backends, extract_pdf_pages)
+from benchmark import make_pdf, make_docx
+from resource_manager import ResourceManager
+from bulk_index import BulkIndexer
+from embedding_cache import EmbeddingCache
+import numpy as np
+import chromadb
+from chromadb.config import Settings
+from question_bank import QuestionBank, generate_questions, lookup_answer
 from qa_engine import QAEngine
 
 def create_test_documents():
@@ -73,7 +88,7 @@ def test_document_loading():
         print(f"✅ Created {len(test_files)} test documents")
         
         # Initialize document store
-        doc_store = DocumentStore(db_path="./test_chroma_db")
+        doc_store = DocumentStore(db_path="./test_chroma_db", build_centroids=True)
         print("✅ Initialized DocumentStore")
         
         # Load documents
@@ -84,6 +99,354 @@ def test_document_loading():
         count = doc_store.get_collection_count()
         print(f"✅ ChromaDB contains {count} chunks")
         
+        # Remove and re-add one document without touching the other
+        test_paths = [os.path.abspath(p) for p in test_files]
+        registered = {s['path'] for s in doc_store.list_documents()}
+        assert set(test_paths) <= registered, "Loaded files missing from registry"
+        removed = doc_store.remove_document(test_files[0])
+        assert doc_store.get_collection_count() == count - removed
+        registered = {s['path'] for s in doc_store.list_documents()}
+        assert test_paths[0] not in registered and test_paths[1] in registered
+        doc_store.replace_document(test_files[0])
+        assert doc_store.get_collection_count() == count
+        print(f"✅ Removed and replaced one document ({removed} chunks)")
+        
+        # Two stores on one database (GUI and bulk_index.py) keep each other's sources
+        other_store = DocumentStore(db_path="./test_chroma_db")
+        doc_store.remove_document(test_files[0])
+        other_store.remove_document(test_files[1])
+        doc_store.load_documents([test_files[0]])
+        other_store.load_documents([test_files[1]])
+        registered = {s['path'] for s in DocumentStore(db_path="./test_chroma_db").list_documents()}
+        assert set(test_paths) <= registered, "Concurrent store lost a source"
+        assert doc_store.remove_document(test_files[1]) > 0
+        assert not doc_store.collection.get(where={"path": test_paths[1]})['ids']
+        doc_store.load_documents([test_files[1]])
+        assert doc_store.get_collection_count() == count
+        print("✅ Two stores on one database keep each other's sources")
+        
+        # A file without text is not an error, even in strict mode
+        empty_path = os.path.join(tempfile.mkdtemp(), "empty.txt")
+        open(empty_path, 'w').close()
+        assert doc_store.prepare_document(empty_path, strict=True) is None
+        print("✅ File without text prepared as None in strict mode")
+        
+        # Re-loading a stored file drops banked answers that quoted it
+        from question_bank import _path_key
+        bank = QuestionBank(doc_store.client, "./test_chroma_db")
+        bank.collection.upsert(ids=["stale"], embeddings=[[0.1] * 384], documents=["Old question?"],
+                               metadatas=[{"answer": "old", "sources": "[]", "path": "",
+                                           "chunk": "x", _path_key(test_paths[1]): 1}])
+        doc_store.load_documents([test_files[1]])
+        assert not bank.collection.get(ids=["stale"])['ids'], "Outdated banked answer kept"
+        print("✅ Re-loading a document drops banked answers citing it")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_docx_extraction():
+    """Test streaming DOCX extraction of paragraphs and table cells."""
+    print("\n" + "="*60)
+    print("TEST: DOCX Extraction")
+    print("="*60)
+    
+    try:
+        docx_path = os.path.join(tempfile.mkdtemp(), "question_bank.docx")
+        with zipfile.ZipFile(docx_path, 'w') as archive:
+            archive.writestr("word/document.xml", """<?xml version="1.0" encoding="UTF-8"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>
+<w:p><w:r><w:t>Tuples</w:t></w:r><w:r><w:tab/><w:t xml:space="preserve">are immutable.</w:t></w:r></w:p>
+<w:p><w:hyperlink><w:r><w:t>See docs</w:t></w:r></w:hyperlink><w:r><w:br/><w:t>next line</w:t></w:r></w:p>
+<w:p/>
+<w:tbl><w:tr>
+<w:tc><w:p><w:r><w:t>What is a set?</w:t></w:r></w:p></w:tc>
+<w:tc><w:p><w:r><w:t>Unique elements</w:t></w:r></w:p><w:p><w:r><w:t>Unordered</w:t></w:r></w:p></w:tc>
+</w:tr></w:tbl>
+</w:body></w:document>""")
+        
+        blocks = list(iter_docx_blocks(docx_path))
+        expected = [
+            (PARAGRAPH, "Tuples\tare immutable."),
+            (PARAGRAPH, "See docs\nnext line"),
+            (PARAGRAPH, ""),
+            (TABLE_CELL, "What is a set?"),
+            (TABLE_CELL, "Unique elements\nUnordered"),
+        ]
+        assert blocks == expected, f"Unexpected blocks: {blocks}"
+        print(f"✅ Extracted {len(blocks)} blocks including table cells")
+        
+        # Finished table rows are released while streaming, so memory does
+        # not grow with the length of a table
+        table_path = os.path.join(tempfile.mkdtemp(), "long_table.docx")
+        make_docx(table_path, paragraphs=0, table_rows=20000)
+        tracemalloc.start()
+        cells = sum(1 for _ in iter_docx_blocks(table_path))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert cells == 40000 and peak < 5 * 1024 * 1024, f"{cells} cells, peak {peak} bytes"
+        print(f"✅ Streamed a 20000-row table with peak {peak / 1024:.0f} KB")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_pdf_extraction():
+    """Test page-ordered PDF extraction across backends and worker counts."""
+    print("\n" + "="*60)
+    print("TEST: PDF Extraction")
+    print("="*60)
+    
+    try:
+        pdf_path = os.path.join(tempfile.mkdtemp(), "textbook.pdf")
+        make_pdf(pdf_path, pages=60, lines_per_page=3)
+        
+        for backend in available_pdf_backends():
+            serial = extract_pdf_pages(pdf_path, backend=backend, workers=1)
+            parallel = extract_pdf_pages(pdf_path, backend=backend, workers=3)
+            assert [p for p, _ in parallel] == list(range(1, 61)), "Pages out of order"
+            assert serial == parallel, f"{backend}: parallel output differs"
+            assert serial[41][1].startswith("Page 42 line 0"), serial[41][1][:40]
+            print(f"✅ {backend}: 60 pages in order, serial and parallel match")
+        
+        positioned_path = os.path.join(tempfile.mkdtemp(), "tex.pdf")
+        make_pdf(positioned_path, pages=1, lines_per_page=2, positioned_words=True)
+        for backend in available_pdf_backends():
+            text = extract_pdf_pages(positioned_path, backend=backend)[0][1]
+            assert "Tuples are ordered, immutable collections." in text, f"{backend}: {text!r}"
+        print("✅ Words separated only by position keep their spaces")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_resource_manager():
+    """Test lazy loading and idle unloading of models."""
+    print("\n" + "="*60)
+    print("TEST: Resource Manager")
+    print("="*60)
+    
+    try:
+        loads = []
+        messages = []
+        resources = ResourceManager(idle_timeout=0.01, min_available_mb=0,
+                                    on_status=messages.append)
+        resources.register("llm", lambda: loads.append(1) or object(), label="LLM")
+        
+        assert not resources.is_loaded("llm")
+        with resources.use("llm") as model:
+            assert model is not None
+            time.sleep(0.02)
+            assert resources.check() == [], "Model in use must not be unloaded"
+        print("✅ Model loaded on first use and kept while in use")
+        
+        time.sleep(0.02)
+        assert resources.check() == ["llm"]
+        assert not resources.is_loaded("llm")
+        print("✅ Idle model unloaded")
+        
+        resources.get("llm")
+        assert len(loads) == 2
+        assert "Warming up LLM..." in messages
+        print("✅ Model reloaded on next use")
+        
+        failures = []
+        resources.register("broken", lambda: failures.append(1), label="Broken")
+        assert resources.get("broken") is None
+        assert resources.get("broken") is None
+        assert len(failures) == 1, "Failed load was retried on every use"
+        resources.reload("broken")
+        assert len(failures) == 2
+        print("✅ Failed load remembered until reload()")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_bulk_index_resume():
+    """Test checkpointed bulk indexing, quarantine and resume."""
+    print("\n" + "="*60)
+    print("TEST: Bulk Index Resume")
+    print("="*60)
+    
+    class FakeStore:
+        """Stands in for DocumentStore so no models are needed."""
+        def __init__(self, db_path, registry):
+            self.db_path = db_path
+            self.registry = registry
+            self.stored = []
+        
+        def prepare_document(self, file_path, strict=False):
+            if "broken" in file_path:
+                raise ValueError("corrupt file")
+            if "scanned" in file_path:
+                return None
+            return {"ids": [file_path], "chunks": ["text"], "metadatas": [{}]}
+        
+        def store_chunks(self, ids, chunks, metadatas):
+            self.stored += ids
+            self.registry.update(ids)
+    
+    try:
+        root = tempfile.mkdtemp()
+        for name in ["a.txt", "b.txt", "broken.txt", "sub/c.txt", "notes.md", "scanned.pdf"]:
+            path = os.path.join(root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("content")
+        
+        db_path = tempfile.mkdtemp()
+        registry = set()
+        store = FakeStore(db_path, registry)
+        result = BulkIndexer(store, root, batch_size=2).run(progress=lambda msg: None)
+        assert result["processed_files"] == 5, result
+        assert len(store.stored) == 3
+        assert result["quarantined"] == 1
+        # A file without text is remembered as empty, not quarantined
+        indexer = BulkIndexer(store, root, batch_size=2)
+        scanned = os.path.join(root, "scanned.pdf")
+        assert scanned in indexer.state["empty"] and scanned not in indexer.state["quarantine"]
+        print("✅ Indexed 3 files, skipped 1 without text and quarantined 1")
+        
+        # A fresh indexer resumes from the checkpoint and skips finished files
+        store = FakeStore(db_path, registry)
+        indexer = BulkIndexer(store, root, batch_size=2)
+        result = indexer.run(progress=lambda msg: None)
+        assert result["processed_files"] == 0 and store.stored == []
+        assert "corrupt file" in list(indexer.state["quarantine"].values())[0]["error"]
+        print("✅ Resumed from checkpoint without re-indexing")
+        
+        # Files removed from the store (or a cleared database) are indexed again
+        registry.discard(os.path.join(root, "a.txt"))
+        store = FakeStore(db_path, registry)
+        result = BulkIndexer(store, root, batch_size=2).run(progress=lambda msg: None)
+        assert store.stored == [os.path.join(root, "a.txt")], store.stored
+        registry.clear()
+        store = FakeStore(db_path, registry)
+        result = BulkIndexer(store, root, batch_size=2).run(progress=lambda msg: None)
+        assert len(store.stored) == 3, store.stored
+        print("✅ Removed and cleared documents re-indexed despite the checkpoint")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_embedding_cache():
+    """Test embedding cache lookups, persistence and LRU eviction."""
+    print("\n" + "="*60)
+    print("TEST: Embedding Cache")
+    print("="*60)
+    
+    try:
+        cache_dir = tempfile.mkdtemp()
+        # Room for exactly 100 vectors of dimension 8
+        cache = EmbeddingCache(cache_dir, "test-model", max_bytes=100 * 8 * 2)
+        texts = [f"chunk {i}" for i in range(100)]
+        vectors = np.random.rand(100, 8).astype(np.float32)
+        
+        assert cache.get_many(texts[:1]) == [None]
+        cache.put_many(texts, vectors)
+        
+        reopened = EmbeddingCache(cache_dir, "test-model", max_bytes=100 * 8 * 2)
+        hit = reopened.get_many(["chunk 7", "unknown"])
+        assert np.allclose(hit[0], vectors[7], atol=1e-3) and hit[1] is None
+        print("✅ Cached vectors persist across instances")
+        
+        reopened.put_many([f"new {i}" for i in range(50)], np.random.rand(50, 8))
+        assert len(reopened) == 100
+        assert reopened.get_many(["chunk 7"])[0] is not None, "Recently used vector evicted"
+        print("✅ Least recently used vectors evicted at capacity")
+        
+        # Two instances on one directory stand in for the GUI and bulk_index.py
+        shared_dir = tempfile.mkdtemp()
+        first = EmbeddingCache(shared_dir, "test-model")
+        second = EmbeddingCache(shared_dir, "test-model")
+        expected = {}
+        for round_no in range(3):
+            for name, cache in (("first", first), ("second", second)):
+                batch = [f"{name} {round_no} {i}" for i in range(10)]
+                batch_vectors = np.random.rand(10, 8).astype(np.float32)
+                cache.put_many(batch, batch_vectors)
+                expected.update(zip(batch, batch_vectors))
+        for cache in (first, second):
+            found = cache.get_many(list(expected))
+            assert all(np.allclose(v, expected[t], atol=1e-3) for t, v in zip(expected, found)), \
+                "Instances sharing a cache handed out the same rows"
+        print("✅ Instances sharing one cache never reuse each other's rows")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_question_bank():
+    """Test question generation, resumable bank building and lookup."""
+    print("\n" + "="*60)
+    print("TEST: Question Bank")
+    print("="*60)
+    
+    class FakeEngine:
+        """Answers every question without a model and counts calls."""
+        def __init__(self):
+            self.calls = 0
+        
+        def embed_question(self, question):
+            digest = hashlib.md5(question.encode()).digest()
+            return [float(b) for b in digest[:8]]
+        
+        def answer_question(self, question, use_bank=True):
+            self.calls += 1
+            return {'answer': f"Answer to {question}", 'sources': ["notes.txt", "other.txt"],
+                    'contexts': [{'text': "...", 'source': "other.txt", 'path': "/other.txt"}],
+                    'stats': {'stop_reason': None}}
+    
+    try:
+        questions = generate_questions(
+            "Python was first released in 1991.\n"
+            "Tuples are ordered, immutable collections.\n"
+            "It was created by Guido van Rossum.\n")
+        assert questions == ["What are Tuples?", "When was Python first released?"], questions
+        print(f"✅ Generated questions: {questions}")
+        
+        db_path = tempfile.mkdtemp()
+        client = chromadb.Client(Settings(is_persistent=True, persist_directory=db_path,
+                                          anonymized_telemetry=False))
+        documents = client.get_or_create_collection("exam_documents")
+        documents.add(ids=["a_0", "a_1"], embeddings=[[0.0] * 8, [1.0] * 8],
+                      documents=["Python was first released in 1991.",
+                                 "Sets are unordered collections."],
+                      metadatas=[{"path": "/notes.txt"}, {"path": "/notes.txt"}])
+        
+        engine = FakeEngine()
+        bank = QuestionBank(client, db_path)
+        assert bank.build(engine, limit=1, progress=lambda msg: None)["processed_chunks"] == 1
+        # A new instance resumes with the remaining chunk only
+        bank = QuestionBank(client, db_path)
+        assert bank.build(engine, progress=lambda msg: None)["processed_chunks"] == 1
+        assert engine.calls == 2
+        coverage = bank.coverage()
+        assert coverage["covered_chunks"] == 2 and coverage["questions"] == 2, coverage
+        print(f"✅ Bank built in two resumable runs: {coverage}")
+        
+        hit = lookup_answer(bank.collection, engine.embed_question("What are Sets?"))
+        assert hit and hit['answer'] == "Answer to What are Sets?"
+        print("✅ Banked answer served for matching question")
+        
+        bank.forget("/other.txt")
+        assert bank.coverage()["questions"] == 0
+        print("✅ Removing a cited source drops the banked answers quoting it")
+        
         return True
         
     except Exception as e:
@@ -155,6 +518,25 @@ def test_context_retrieval():
                 print(f"  Distance: {ctx['distance']:.4f}")
             print()
         
+        two_stage = qa_engine.retrieve_context(question, top_k=3, strategy="two_stage")
+        assert [c['text'] for c in two_stage] == [c['text'] for c in contexts], \
+            "Two-stage retrieval should match flat search on a small corpus"
+        assert qa_engine._centroid_collection() is not None, "No section centroids stored"
+        print("✅ Two-stage retrieval matches flat search")
+        
+        # The engine's retrieval_strategy applies when no strategy is given
+        import qa_engine as qa_module
+        searches = []
+        original_search = qa_module.two_stage_search
+        qa_module.two_stage_search = lambda *args: searches.append(args) or original_search(*args)
+        try:
+            engine = QAEngine(db_path="./test_chroma_db", retrieval_strategy="two_stage")
+            assert engine.retrieve_context(question, top_k=3) == two_stage
+        finally:
+            qa_module.two_stage_search = original_search
+        assert searches, "retrieval_strategy was not used"
+        print("✅ retrieval_strategy selects two-stage retrieval")
+        
         print("✅ Context retrieval test completed")
         return True
         
@@ -162,6 +544,290 @@ def test_context_retrieval():
         print(f"❌ Test failed: {str(e)}")
         return False
 
+class ScriptedLLM:
+    """Stands in for GPT4All: emits a fixed list of tokens, calling on_emit before each."""
+    
+    def __init__(self, tokens, on_emit=None):
+        self.tokens = tokens
+        self.on_emit = on_emit
+        self.emitted = 0
+    
+    def generate(self, prompt, max_tokens=200, callback=None, **kwargs):
+        self.emitted = 0
+        for i, token in enumerate(self.tokens[:max_tokens]):
+            if self.on_emit:
+                self.on_emit(i)
+            self.emitted += 1
+            if not callback(i, token):
+                break
+        return ""
+
+def test_generation_controls():
+    """Test token budgets, stop sequences, the not-found early stop and cancellation."""
+    print("\n" + "="*60)
+    print("TEST: Generation Controls (stub LLM)")
+    print("="*60)
+    
+    try:
+        from qa_engine import (CancelToken, CANCELLED_MESSAGE, NOT_FOUND_MESSAGE,
+                               SHORT_ANSWER_TOKENS, LIST_ANSWER_TOKENS, LONG_ANSWER_TOKENS,
+                               max_tokens_for_question)
+        
+        budgets = {
+            "Explain how lists work": LONG_ANSWER_TOKENS,
+            "How does garbage collection work?": LONG_ANSWER_TOKENS,
+            "What are the key features of Python?": LIST_ANSWER_TOKENS,
+            "How many keywords does Python have?": SHORT_ANSWER_TOKENS,
+            "How old is Python?": SHORT_ANSWER_TOKENS,
+            "Who created Python?": SHORT_ANSWER_TOKENS,
+        }
+        for question, expected in budgets.items():
+            assert max_tokens_for_question(question) == expected, question
+        print("✅ Token budgets chosen by question type")
+        
+        llm = ScriptedLLM([])
+        resources = ResourceManager(idle_timeout=0)
+        resources.register("llm", lambda: llm, label="LLM")
+        qa_engine = QAEngine(db_path="./test_chroma_db", resources=resources)
+        contexts = [{'text': "Python was created by Guido van Rossum.", 'source': "a.txt"}]
+        
+        llm.tokens = ["Guido", " van", " Rossum", ".", "\nQuestion", ":", " Who", " else", "?"]
+        answer, stats = qa_engine._generate("Who created Python?", contexts)
+        assert answer == "Guido van Rossum.", answer
+        assert stats['stop_reason'] == 'stop_sequence' and llm.emitted == 6
+        print("✅ Generation stops at a stop sequence")
+        
+        for opening in ["Answer", ' "Answer', "“Answer"]:
+            llm.tokens = [opening, " not", " found", " in", " the", " provided"] + [" x"] * 50
+            answer, stats = qa_engine._generate("What is Java?", contexts)
+            assert answer == NOT_FOUND_MESSAGE, answer
+            assert stats['stop_reason'] == 'not_found' and llm.emitted == 3, opening
+        print("✅ Not-found sentinel stops generation, quoted or not")
+        
+        llm.tokens = [" word"] * 500
+        _, stats = qa_engine._generate("Who created Python?", contexts)
+        assert stats['stop_reason'] == 'max_tokens' and llm.emitted == SHORT_ANSWER_TOKENS
+        print("✅ Generation capped at max_tokens")
+        
+        token = CancelToken()
+        llm.on_emit = lambda i: i == 3 and token.cancel()
+        answer, stats = qa_engine._generate("Who created Python?", contexts, cancel_token=token)
+        assert answer == CANCELLED_MESSAGE and stats['stop_reason'] == 'cancelled'
+        assert llm.emitted == 4 and stats['tokens'] == 3
+        print("✅ Cancelling stops generation at the next token")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+class StubLLM:
+    """Stands in for GPT4All: emits a fixed answer slowly, one word per token."""
+    
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self.stopped_early = 0
+    
+    def generate(self, prompt, max_tokens=200, callback=None, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        self.calls += 1
+        try:
+            words = "Python is a high-level programming language. ".split(" ") * 20
+            for i, word in enumerate(words[:max_tokens]):
+                time.sleep(self.delay)
+                if not callback(i, word + " "):
+                    self.stopped_early += 1
+                    break
+        finally:
+            self.active -= 1
+        return ""
+
+class StubLLModel:
+    """Stands in for GPT4All's low-level model: one token per word, counts evaluated tokens."""
+    
+    def __init__(self):
+        self.context = None
+        self.tokens = []
+        self.evaluated = 0
+    
+    @staticmethod
+    def _recalculate_callback(is_recalculating):
+        return is_recalculating
+    
+    def prompt_model(self, prompt, n_predict=4096, reset_context=False, callback=None, **kwargs):
+        if self.context is None:
+            self.context = type("Context", (), {"n_past": 0, "n_ctx": 2048})()
+        if reset_context:
+            self.context.n_past = 0
+        # Positions past n_past are overwritten, like the KV cache
+        del self.tokens[self.context.n_past:]
+        words = prompt.split()
+        self.tokens.extend(words)
+        self.evaluated += len(words)
+        self.context.n_past = len(self.tokens)
+        for i, word in enumerate("Python is a high-level programming language.".split()[:n_predict]):
+            self.tokens.append(word)
+            self.context.n_past += 1
+            if not callback(i, word + " "):
+                break
+
+class StubSessionLLM:
+    """GPT4All stand-in exposing the low-level model used for prefix sessions."""
+    
+    def __init__(self):
+        self.model = StubLLModel()
+    
+    def generate(self, prompt, max_tokens=200, callback=None, **kwargs):
+        self.model.prompt_model(prompt, n_predict=max_tokens, reset_context=True, callback=callback)
+        return ""
+
+def test_prefix_session():
+    """Test that the instruction prefix is evaluated once and not leaked across questions."""
+    print("\n" + "="*60)
+    print("TEST: Instruction Prefix Session (stub backend)")
+    print("="*60)
+    
+    try:
+        from qa_engine import INSTRUCTION_PREFIX
+        
+        stub = StubSessionLLM()
+        resources = ResourceManager(idle_timeout=0)
+        resources.register("llm", lambda: stub, label="LLM")
+        qa_engine = QAEngine(db_path="./test_chroma_db", resources=resources,
+                             prefix_session=True)
+        prefix_tokens = len(INSTRUCTION_PREFIX.split())
+        contexts = [{'text': "Python was created by Guido van Rossum.", 'source': "a.txt"}]
+        
+        answer, first = qa_engine._generate("Who created Python?", contexts)
+        assert answer.startswith("Python is"), answer
+        assert not first['prefix_reused'] and first['prompt_eval'] is not None
+        
+        before = stub.model.evaluated
+        _, second = qa_engine._generate("What is Python?", contexts)
+        question_tokens = stub.model.evaluated - before
+        assert second['prefix_reused'], "Prefix was evaluated again"
+        assert stub.model.tokens[:prefix_tokens] == INSTRUCTION_PREFIX.split()
+        assert "Who" not in stub.model.tokens[prefix_tokens:], "Earlier question leaked"
+        print(f"✅ Second question evaluated {question_tokens} tokens, "
+              f"prefix of {prefix_tokens} reused")
+        
+        # A plain generate() call overwrites the context; the session must notice
+        stub.generate("unrelated prompt", max_tokens=5, callback=lambda *a: True)
+        _, third = qa_engine._generate("What is Python?", contexts)
+        assert not third['prefix_reused'], "Stale prefix was reused"
+        assert stub.model.tokens[:prefix_tokens] == INSTRUCTION_PREFIX.split()
+        print("✅ Prefix re-evaluated after the context was overwritten")
+        
+        # Unloading the LLM must free the low-level model the session primed
+        import gc
+        import weakref
+        loaded = []
+        
+        def load_stub():
+            llm = StubSessionLLM()
+            loaded.append(weakref.ref(llm.model))
+            return llm
+        
+        unload_resources = ResourceManager(idle_timeout=0)
+        unload_resources.register("llm", load_stub, label="LLM")
+        unload_engine = QAEngine(db_path="./test_chroma_db", resources=unload_resources,
+                                 prefix_session=True)
+        unload_engine._generate("What is Python?", contexts)
+        assert unload_resources.unload("llm")
+        gc.collect()
+        assert loaded[0]() is None, "Unloaded model still referenced by the session"
+        _, reloaded = unload_engine._generate("What is Python?", contexts)
+        assert len(loaded) == 2 and not reloaded['prefix_reused']
+        print("✅ Unloading the LLM frees the primed model; reload primes again")
+        
+        qa_engine.prefix_session = False
+        before = stub.model.evaluated
+        qa_engine._generate("What is Python?", contexts)
+        assert stub.model.evaluated - before == prefix_tokens + question_tokens
+        print("✅ Full-prompt mode evaluates the whole prompt")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
+def test_async_answering():
+    """Test the asyncio API with a stub LLM: overlap, serialization, cancellation."""
+    print("\n" + "="*60)
+    print("TEST: Async Question Answering (stub LLM)")
+    print("="*60)
+    
+    try:
+        import asyncio
+        
+        stub = StubLLM()
+        resources = ResourceManager(idle_timeout=0)
+        resources.register("llm", lambda: stub, label="LLM")
+        qa_engine = QAEngine(db_path="./test_chroma_db", resources=resources)
+        
+        questions = ["What is Python?", "Who created Python?", "What is a dictionary?"]
+        
+        # Every retrieval waits until all three are in flight at once
+        retrieve_context = qa_engine.retrieve_context
+        barrier = threading.Barrier(len(questions), timeout=10)
+        
+        def blocking_retrieval(*args, **kwargs):
+            barrier.wait()
+            return retrieve_context(*args, **kwargs)
+        
+        qa_engine.retrieve_context = blocking_retrieval
+        
+        async def run_all():
+            return await asyncio.gather(*[
+                qa_engine.answer_question_async(q, use_bank=False) for q in questions])
+        
+        results = asyncio.run(run_all())
+        qa_engine.retrieve_context = retrieve_context
+        assert len(results) == len(questions)
+        assert all(r['answer'].startswith("Python is") for r in results), results[0]['answer']
+        print(f"✅ Retrieval for {len(questions)} gathered questions ran concurrently")
+        
+        # The sync path from another thread (like the GUI's QAThread) shares the LLM
+        sync_thread = threading.Thread(
+            target=lambda: [qa_engine.answer_question(q, use_bank=False) for q in questions])
+        sync_thread.start()
+        asyncio.run(run_all())
+        sync_thread.join()
+        assert stub.max_active == 1, "Generations overlapped"
+        print("✅ Async and sync generation serialized")
+        
+        async def cancel_one():
+            task = asyncio.create_task(qa_engine.answer_question_async(
+                "Explain Python", use_bank=False))
+            while not stub.active:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                return True
+            return False
+        
+        assert asyncio.run(cancel_one()), "Task was not cancelled"
+        assert stub.active == 0 and stub.stopped_early == 1, "Generation kept running"
+        print("✅ Cancelling the task stopped generation")
+        
+        qa_engine.close()
+        assert qa_engine._retrieval_executor is None and qa_engine._llm_executor is None
+        print("✅ close() stopped the worker threads")
+        
+        return True
+        
+    except Exception as e:
+        print(f"❌ Test failed: {str(e)}")
+        return False
+
 def cleanup_test_data():
     """Clean up test database."""
     print("\n" + "="*60)
@@ -185,8 +851,17 @@ def main():
     results = []
     
     # Run tests
+    results.append(("DOCX Extraction", test_docx_extraction()))
+    results.append(("PDF Extraction", test_pdf_extraction()))
+    results.append(("Resource Manager", test_resource_manager()))
+    results.append(("Bulk Index Resume", test_bulk_index_resume()))
+    results.append(("Embedding Cache", test_embedding_cache()))
+    results.append(("Question Bank", test_question_bank()))
     results.append(("Document Loading", test_document_loading()))
     results.append(("Context Retrieval", test_context_retrieval()))
+    results.append(("Generation Controls", test_generation_controls()))
+    results.append(("Async Answering", test_async_answering()))
+    results.append(("Prefix Session", test_prefix_session()))
     
     # Only test QA if GPT4All model is available
     print("\n⚠️  Note: Question Answering test requires GPT4All model")